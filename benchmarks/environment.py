@@ -0,0 +1,64 @@
+import os
+
+from .fakes import FakeServices
+
+ADMIN_CHAT_ID = 1000
+WEBHOOK_TOKEN = "benchmark"
+
+
+def configure_environment(fakes: FakeServices, admin_chat_ids: list[int]) -> None:
+    # must run before telegram_bot_service is imported, settings are read on import
+    os.environ.update(
+        {
+            "TELEGRAM_BOT_TOKEN": "1:benchmark",
+            "TELEGRAM_WEBHOOK_TOKEN": WEBHOOK_TOKEN,
+            "TELEGRAM_API_BASE_URL": fakes.url("bot_api", "/bot"),
+            "USER_SERVICE_URL": fakes.url("user", "/users"),
+            "USER_SERVICE_TIMEOUT": "15",
+            "TRAINING_PLAN_SERVICE_URL": fakes.url("training_plan", "/plans"),
+            "TRAINING_PLAN_SERVICE_TIMEOUT": "15",
+            "PAYMENT_SERVICE_URL": fakes.url("payment", "/payments"),
+            "PAYMENT_SERVICE_TIMEOUT": "15",
+            "BOT_ADMIN_CHAT_IDS": str(admin_chat_ids),
+            "BOT_DEVELOPER_CHAT_IDS": f"[{ADMIN_CHAT_ID}]",
+            "TRACING_ENABLED": "true",
+            "TRACING_SAMPLE_RATE": "1",
+        }
+    )
+
+    for key, value in {
+        "REDIS_HOST": "localhost",
+        "REDIS_PORT": "6379",
+        "REDIS_LANGUAGE_DB": "0",
+        "REDIS_ADMIN_NOTIFICATION_DB": "1",
+        "RATE_LIMIT_ENABLED": "false",
+        "FUNNEL_ENABLED": "true",
+        "RECORDING_SALT": "benchmark-recording-salt",
+        "LOG_LEVEL": "WARNING",
+        "LOG_FORMAT": "%(levelname)s %(message)s",
+        "LOG_DATE_FORMAT": "%H:%M:%S",
+    }.items():
+        os.environ.setdefault(key, value)
+
+
+def install_fake_redis() -> bool:
+    try:
+        import fakeredis
+    except ImportError:
+        return False
+
+    from redis import ConnectionPool
+
+    from telegram_bot_service.storage import redis_clients
+
+    server = fakeredis.FakeServer()
+
+    for client in redis_clients:
+        client.connection_pool = ConnectionPool(
+            connection_class=fakeredis.FakeConnection,  # type: ignore [arg-type]
+            server=server,
+            db=client.connection_pool.connection_kwargs.get("db", 0),
+            decode_responses=True,
+        )
+
+    return True
@@ -0,0 +1,193 @@
+import asyncio
+import itertools
+import socket
+import time
+import uuid
+from typing import Any
+
+import uvicorn
+from fastapi import FastAPI, Request, Response, status
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return int(sock.getsockname()[1])
+
+
+class FakeServices:
+    def __init__(self, latency: float = 0) -> None:
+        self.latency = latency
+
+        self.bot_api_calls: dict[str, int] = {}
+        self.payments: dict[str, dict[str, Any]] = {}
+        self.payment_ids_by_user: dict[int, str] = {}
+        self.message_ids = itertools.count(1)
+
+        self.ports = {
+            name: get_free_port()
+            for name in ("bot_api", "user", "training_plan", "payment")
+        }
+        self.servers: list[uvicorn.Server] = []
+        self.tasks: list[asyncio.Task[None]] = []
+
+    def url(self, name: str, path: str) -> str:
+        return f"http://127.0.0.1:{self.ports[name]}{path}"
+
+    async def start(self) -> None:
+        apps = {
+            "bot_api": self.build_bot_api(),
+            "user": self.build_user_service(),
+            "training_plan": self.build_training_plan_service(),
+            "payment": self.build_payment_service(),
+        }
+
+        for name, app in apps.items():
+            server = uvicorn.Server(
+                uvicorn.Config(
+                    app, port=self.ports[name], log_level="warning", lifespan="off"
+                )
+            )
+            self.tasks.append(asyncio.create_task(server.serve()))
+            self.servers.append(server)
+
+        while not all(server.started for server in self.servers):
+            await asyncio.sleep(0.01)
+
+    async def stop(self) -> None:
+        for server in self.servers:
+            server.should_exit = True
+
+        await asyncio.gather(*self.tasks)
+
+    async def delay(self) -> None:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def build_bot_api(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.post("/bot{token}/{method}")
+        async def call_method(method: str) -> dict[str, Any]:
+            self.bot_api_calls[method] = self.bot_api_calls.get(method, 0) + 1
+            await self.delay()
+
+            result: Any = True
+
+            if method == "getMe":
+                result = {
+                    "id": 1,
+                    "is_bot": True,
+                    "first_name": "Benchmark",
+                    "username": "benchmark_bot",
+                }
+
+            elif method == "copyMessage":
+                result = {"message_id": next(self.message_ids)}
+
+            elif method.startswith("send"):
+                result = {
+                    "message_id": next(self.message_ids),
+                    "date": int(time.time()),
+                    "chat": {"id": 1, "type": "private"},
+                }
+
+            return {"ok": True, "result": result}
+
+        return app
+
+    def build_user_service(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.post("/users/")
+        async def create_user(request: Request) -> Any:
+            await self.delay()
+            return await request.json()
+
+        return app
+
+    def build_training_plan_service(self) -> FastAPI:
+        from telegram_bot_service.training_plan import (
+            Environment,
+            Frequency,
+            Goal,
+            Level,
+            Sex,
+        )
+
+        filter_enums = {
+            filter_enum.__name__.lower(): filter_enum
+            for filter_enum in (Sex, Goal, Environment, Level, Frequency)
+        }
+        plan = {
+            "notion_id": "benchmark-plan",
+            "url": "https://example.com/plan",
+            "title": "Benchmark plan",
+            "price": 500.0,
+            "content_url": "https://example.com/content",
+        }
+
+        app = FastAPI()
+
+        @app.get("/plans/")
+        async def get_plans() -> list[dict[str, Any]]:
+            await self.delay()
+            return [plan]
+
+        @app.put("/plans/")
+        async def fetch_plans() -> Response:
+            await self.delay()
+            return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+        @app.get("/plans/property/{name}/")
+        async def get_property_values(name: str) -> list[str]:
+            await self.delay()
+            return [value.value for value in filter_enums[name]]
+
+        @app.get("/plans/{training_plan_id}/")
+        async def get_plan(training_plan_id: str) -> dict[str, Any]:
+            await self.delay()
+            return plan
+
+        return app
+
+    def build_payment_service(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.post("/payments/")
+        async def create_payment(request: Request) -> dict[str, Any]:
+            await self.delay()
+
+            payment: dict[str, Any] = {
+                "_id": uuid.uuid4().hex,
+                **(await request.json()),
+            }
+            self.payments[payment["_id"]] = payment
+            self.payment_ids_by_user[payment["user"]["telegram_id"]] = payment["_id"]
+
+            return payment
+
+        @app.put("/payments/{payment_id}/")
+        async def update_payment(payment_id: str, request: Request) -> dict[str, Any]:
+            await self.delay()
+
+            # replayed recordings reference payments this fake never created
+            payment = self.payments.setdefault(
+                payment_id,
+                {
+                    "_id": payment_id,
+                    "user": {"telegram_id": 1},
+                    "items": [
+                        {
+                            "price": 500.0,
+                            "item_type": 1,
+                            "training_plan_id": "benchmark-plan",
+                        }
+                    ],
+                },
+            )
+            payment["status"] = (await request.json())["status"]
+
+            return payment
+
+        return app
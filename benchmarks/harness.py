@@ -0,0 +1,80 @@
+import resource
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator
+
+import httpx
+
+from .environment import ADMIN_CHAT_ID, configure_environment, install_fake_redis
+from .fakes import FakeServices
+
+
+@dataclass
+class Harness:
+    client: httpx.AsyncClient
+    fakes: FakeServices
+    redis: str
+    durations: dict[str, list[float]] = field(default_factory=dict)
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summarize(durations: list[float]) -> dict[str, float]:
+    return {
+        "count": len(durations),
+        "p50_ms": percentile(durations, 0.50) * 1000,
+        "p95_ms": percentile(durations, 0.95) * 1000,
+        "p99_ms": percentile(durations, 0.99) * 1000,
+    }
+
+
+def get_max_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@asynccontextmanager
+async def start_harness(
+    backend_latency: float = 0,
+    local_redis: bool = False,
+    admin_chat_ids: list[int] | None = None,
+) -> AsyncIterator[Harness]:
+    fakes = FakeServices(latency=backend_latency)
+    configure_environment(fakes, admin_chat_ids or [ADMIN_CHAT_ID])
+
+    from telegram_bot_service import build_app, tracing
+
+    durations: dict[str, list[float]] = {}
+
+    class DurationExporter(tracing.TraceExporter):
+        def add(self, spans: list[tracing.Span]) -> None:
+            for span in spans:
+                if span.name == "update" or span.name.startswith("handler "):
+                    durations.setdefault(span.name, []).append(span.duration or 0)
+
+    tracing.exporter = DurationExporter()
+
+    app = build_app()
+    redis = "local" if local_redis or not install_fake_redis() else "fake"
+
+    await fakes.start()
+
+    try:
+        async with app.router.lifespan_context(app), httpx.AsyncClient(
+            app=app, base_url="http://benchmark"
+        ) as client:
+            yield Harness(client, fakes, redis, durations)
+
+    finally:
+        await fakes.stop()
+
+
+def summarize_harness(harness: Harness) -> dict[str, Any]:
+    return {
+        "latency": {
+            name: summarize(values) for name, values in harness.durations.items()
+        },
+        "bot_api_calls": harness.fakes.bot_api_calls,
+    }
@@ -0,0 +1,140 @@
+import argparse
+import json
+import timeit
+import tracemalloc
+from typing import Any, Callable
+
+from pydantic import BaseModel, Field
+
+from .environment import configure_environment
+from .fakes import FakeServices
+
+
+class PydanticUser(BaseModel):
+    telegram_id: int
+
+
+class PydanticItem(BaseModel):
+    price: float
+
+    item_type: int
+    training_plan_id: str | None
+
+
+class PydanticPayment(BaseModel):
+    id: str = Field(alias="_id")
+
+    user: PydanticUser
+    items: list[PydanticItem]
+
+
+class PydanticTrainingPlan(BaseModel):
+    notion_id: str
+    url: str
+
+    title: str
+    price: float
+    content_url: str
+
+
+def get_payloads(count: int) -> dict[str, bytes]:
+    return {
+        "payment": json.dumps(
+            [
+                {
+                    "_id": f"payment-{index}",
+                    "user": {"telegram_id": 10_000 + index},
+                    "items": [
+                        {"price": 100.0, "item_type": 1, "training_plan_id": "plan"}
+                    ],
+                }
+                for index in range(count)
+            ]
+        ).encode(),
+        "training_plan": json.dumps(
+            [
+                {
+                    "notion_id": f"plan-{index}",
+                    "url": f"https://notion.so/plan-{index}",
+                    "title": f"Plan {index}",
+                    "price": 100.0,
+                    "content_url": f"https://notion.so/plan-{index}/content",
+                }
+                for index in range(count)
+            ]
+        ).encode(),
+    }
+
+
+def measure(decode: Callable[[bytes], list[Any]], raw: bytes, repeat: int) -> Any:
+    seconds = min(timeit.repeat(lambda: decode(raw), number=1, repeat=repeat))
+
+    tracemalloc.start()
+    # json.loads allocations are freed before the snapshot, only objects count
+    objects = decode(raw)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return seconds, memory, len(objects)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compare construction cost and memory of the data models"
+    )
+    parser.add_argument("--objects", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    arguments = parser.parse_args()
+
+    # settings are read on import, the models need a configured environment
+    configure_environment(FakeServices(), [])
+
+    from telegram_bot_service.config import settings
+    from telegram_bot_service.models import decode_json_list
+    from telegram_bot_service.payment import Payment
+    from telegram_bot_service.training_plan import TrainingPlan
+
+    def decode_strict(model: Any) -> Callable[[bytes], list[Any]]:
+        def decode(raw: bytes) -> list[Any]:
+            settings.model_validation = True
+
+            try:
+                return decode_json_list(model, raw)
+            finally:
+                settings.model_validation = False
+
+        return decode
+
+    decoders: dict[str, dict[str, Callable[[bytes], list[Any]]]] = {
+        "payment": {
+            "pydantic": lambda raw: [
+                PydanticPayment(**data) for data in json.loads(raw)
+            ],
+            "slotted": lambda raw: decode_json_list(Payment, raw),
+            "slotted strict": decode_strict(Payment),
+        },
+        "training_plan": {
+            "pydantic": lambda raw: [
+                PydanticTrainingPlan(**data) for data in json.loads(raw)
+            ],
+            "slotted": lambda raw: decode_json_list(TrainingPlan, raw),
+            "slotted strict": decode_strict(TrainingPlan),
+        },
+    }
+
+    payloads = get_payloads(arguments.objects)
+
+    print(f"{'model':<35}{'us/object':>12}{'bytes/object':>15}")
+
+    for name, model_decoders in decoders.items():
+        for variant, decode in model_decoders.items():
+            seconds, memory, count = measure(decode, payloads[name], arguments.repeat)
+
+            print(
+                f"{f'{name} ({variant})':<35}{seconds / count * 10**6:>12.2f}"
+                f"{memory / count:>15.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
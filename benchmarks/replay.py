@@ -0,0 +1,147 @@
+import argparse
+import asyncio
+import gzip
+import json
+import time
+from pathlib import Path
+from typing import Any
+
+from .harness import get_max_rss_mb, start_harness, summarize_harness
+from .run import print_report
+from .scenarios import build_message, get_survey_texts, post_update
+
+CHECK_TELEGRAM_ID = 20_000
+
+
+def load_recording(paths: list[Path]) -> list[dict[str, Any]]:
+    lines: list[dict[str, Any]] = []
+
+    for path in paths:
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            lines.extend(json.loads(line) for line in file if line.strip())
+
+    return sorted(lines, key=lambda line: line["timestamp"])
+
+
+def get_admin_chat_ids(lines: list[dict[str, Any]]) -> list[int]:
+    return sorted(
+        {
+            value["from"]["id"]
+            for line in lines
+            if line["admin"]
+            for value in line["update"].values()
+            if isinstance(value, dict) and "from" in value
+        }
+    )
+
+
+async def replay(arguments: argparse.Namespace) -> dict[str, Any]:
+    lines = load_recording(arguments.recordings)
+    first_timestamp = lines[0]["timestamp"]
+
+    async with start_harness(
+        local_redis=arguments.local_redis, admin_chat_ids=get_admin_chat_ids(lines)
+    ) as harness:
+        started = time.perf_counter()
+        tasks = []
+
+        for line in lines:
+            if arguments.speed:
+                offset = (line["timestamp"] - first_timestamp) / arguments.speed
+                await asyncio.sleep(max(0, offset - (time.perf_counter() - started)))
+
+                # arrival order is kept, processing overlaps as in production
+                tasks.append(
+                    asyncio.create_task(post_update(harness.client, line["update"]))
+                )
+            else:
+                await post_update(harness.client, line["update"])
+
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    return {
+        "updates": len(lines),
+        "elapsed_seconds": elapsed,
+        "updates_per_second": len(lines) / elapsed,
+        "recorded_seconds": lines[-1]["timestamp"] - first_timestamp,
+        **summarize_harness(harness),
+        "memory": {"max_rss_mb": get_max_rss_mb()},
+    }
+
+
+async def check_survey_replay(arguments: argparse.Namespace) -> None:
+    async with start_harness(local_redis=arguments.local_redis) as harness:
+        from telegram_bot_service.funnel import FUNNEL_STREAM_KEY
+        from telegram_bot_service.payment import PaymentStatus
+        from telegram_bot_service.recording import anonymize, anonymize_id
+        from telegram_bot_service.storage import service_redis
+
+        # the updates are stored as the recorder writes them, so a button the
+        # recorder replaces with a placeholder leaves the survey stuck
+        for text in get_survey_texts():
+            await post_update(
+                harness.client, anonymize(build_message(CHECK_TELEGRAM_ID, text))
+            )
+
+        payment_id = harness.fakes.payment_ids_by_user.get(
+            anonymize_id(CHECK_TELEGRAM_ID), ""
+        )
+        status = harness.fakes.payments.get(payment_id, {}).get("status")
+
+    # the screenshot, the last survey step, sends the payment to processing
+    if status != PaymentStatus.PROCESSING.value:
+        raise SystemExit("recorded survey run did not reach the payment screenshot")
+
+    # the funnel hashes the already anonymized id once more, events were
+    # flushed on shutdown
+    funnel_user = str(anonymize_id(anonymize_id(CHECK_TELEGRAM_ID)))
+    typed_steps = [
+        event["from"]
+        for _, event in service_redis.xrange(FUNNEL_STREAM_KEY)
+        if event["user"] == funnel_user and event["choice"] == "<text>"
+    ]
+
+    if typed_steps:
+        raise SystemExit(f"funnel recorded keyboard choices as text in {typed_steps}")
+
+    print("recorded survey run replays to the end")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Replay recorded updates against stubbed backends"
+    )
+    parser.add_argument("recordings", type=Path, nargs="*")
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1,
+        help="1 replays at original speed, N at N times speed, 0 as fast as possible",
+    )
+    parser.add_argument("--local-redis", action="store_true")
+    parser.add_argument("--output", type=Path)
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="replay an anonymized survey run and fail unless it completes",
+    )
+    arguments = parser.parse_args()
+
+    if arguments.check:
+        asyncio.run(check_survey_replay(arguments))
+        return
+
+    if not arguments.recordings:
+        parser.error("recordings are required without --check")
+
+    results = asyncio.run(replay(arguments))
+
+    if arguments.output:
+        arguments.output.write_text(json.dumps(results, indent=2))
+
+    print_report(results, None)
+
+
+if __name__ == "__main__":
+    main()
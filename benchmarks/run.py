@@ -0,0 +1,127 @@
+import argparse
+import asyncio
+import json
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from .harness import get_max_rss_mb, start_harness, summarize_harness
+from .scenarios import run_survey_flow
+
+RESULTS_DIRECTORY = Path(__file__).parent / "results"
+
+
+def get_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def run_benchmark(arguments: argparse.Namespace) -> dict[str, Any]:
+    async with start_harness(
+        backend_latency=arguments.backend_latency / 1000,
+        local_redis=arguments.local_redis,
+    ) as harness:
+        if arguments.tracemalloc:
+            tracemalloc.start()
+
+        semaphore = asyncio.Semaphore(arguments.concurrency)
+
+        async def run_user(telegram_id: int) -> int:
+            async with semaphore:
+                return await run_survey_flow(harness.client, harness.fakes, telegram_id)
+
+        started = time.perf_counter()
+        update_counts = await asyncio.gather(
+            *(run_user(10_000 + index) for index in range(arguments.users))
+        )
+        elapsed = time.perf_counter() - started
+
+    return {
+        "commit": get_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "parameters": {
+            "users": arguments.users,
+            "concurrency": arguments.concurrency,
+            "backend_latency_ms": arguments.backend_latency,
+            "redis": harness.redis,
+        },
+        "updates": sum(update_counts),
+        "elapsed_seconds": elapsed,
+        "updates_per_second": sum(update_counts) / elapsed,
+        **summarize_harness(harness),
+        "memory": {
+            "max_rss_mb": get_max_rss_mb(),
+            "tracemalloc_peak_mb": (
+                tracemalloc.get_traced_memory()[1] / 2**20
+                if arguments.tracemalloc
+                else None
+            ),
+        },
+    }
+
+
+def print_report(results: dict[str, Any], baseline: dict[str, Any] | None) -> None:
+    print(
+        f"{results['updates']} updates in {results['elapsed_seconds']:.2f}s, "
+        f"{results['updates_per_second']:.1f} updates/s"
+    )
+
+    if baseline:
+        print(f"baseline ({baseline['commit']}): {baseline['updates_per_second']:.1f}")
+
+    print(f"{'span':<45}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+
+    for name, summary in sorted(results["latency"].items()):
+        line = (
+            f"{name:<45}{summary['count']:>8}{summary['p50_ms']:>10.2f}"
+            f"{summary['p95_ms']:>10.2f}{summary['p99_ms']:>10.2f}"
+        )
+
+        if baseline and (previous := baseline["latency"].get(name)):
+            line += f"  (p95 {summary['p95_ms'] - previous['p95_ms']:+.2f})"
+
+        print(line)
+
+    print(f"memory: {results['memory']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Drive the bot through full survey and payment flows"
+    )
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--backend-latency", type=float, default=0, help="ms")
+    parser.add_argument("--local-redis", action="store_true")
+    parser.add_argument("--tracemalloc", action="store_true")
+    parser.add_argument("--baseline", type=Path, help="earlier results file")
+    parser.add_argument("--output", type=Path)
+    arguments = parser.parse_args()
+
+    results = asyncio.run(run_benchmark(arguments))
+
+    output = arguments.output or RESULTS_DIRECTORY / (
+        f"{results['timestamp'].replace(':', '-')}-{results['commit']}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+
+    baseline = (
+        json.loads(arguments.baseline.read_text()) if arguments.baseline else None
+    )
+    print_report(results, baseline)
+    print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
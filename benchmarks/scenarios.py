@@ -0,0 +1,95 @@
+import itertools
+import time
+from typing import Any
+
+import httpx
+
+from .environment import ADMIN_CHAT_ID, WEBHOOK_TOKEN
+from .fakes import FakeServices
+
+update_ids = itertools.count(1)
+
+
+def build_message(telegram_id: int, text: str | None = None) -> dict[str, Any]:
+    message: dict[str, Any] = {
+        "message_id": next(update_ids),
+        "date": int(time.time()),
+        "chat": {"id": telegram_id, "type": "private"},
+        "from": {"id": telegram_id, "is_bot": False, "first_name": "Benchmark"},
+    }
+
+    if text is None:
+        message["photo"] = [
+            {"file_id": "photo", "file_unique_id": "photo", "width": 1, "height": 1}
+        ]
+
+    else:
+        message["text"] = text
+
+        if text.startswith("/"):
+            message["entities"] = [
+                {"type": "bot_command", "offset": 0, "length": len(text)}
+            ]
+
+    return {"update_id": next(update_ids), "message": message}
+
+
+def build_callback_query(telegram_id: int, data: str) -> dict[str, Any]:
+    return {
+        "update_id": next(update_ids),
+        "callback_query": {
+            "id": str(next(update_ids)),
+            "chat_instance": "benchmark",
+            "data": data,
+            "from": {"id": telegram_id, "is_bot": False, "first_name": "Admin"},
+            "message": {
+                "message_id": next(update_ids),
+                "date": int(time.time()),
+                "chat": {"id": telegram_id, "type": "private"},
+            },
+        },
+    }
+
+
+def get_survey_texts() -> list[str | None]:
+    from telegram_bot_service.language import Language, get_translation
+
+    translate = get_translation(Language.UKRAINIAN)
+
+    return [
+        "/start",
+        translate("individual_training_plan_button"),
+        translate("start_button"),
+        translate("sex_male_button"),
+        translate("age_group_under_20_button"),
+        translate("health_condition_positive_button"),
+        translate("goal_muscle_gain_button"),
+        translate("environment_gym_button"),
+        translate("level_beginner_button"),
+        translate("frequency_twice_button"),
+        None,  # payment screenshot
+    ]
+
+
+async def post_update(client: httpx.AsyncClient, update: dict[str, Any]) -> None:
+    response = await client.post(
+        "/", json=update, headers={"X-Telegram-Bot-Api-Secret-Token": WEBHOOK_TOKEN}
+    )
+    response.raise_for_status()
+
+
+async def run_survey_flow(
+    client: httpx.AsyncClient, fakes: FakeServices, telegram_id: int
+) -> int:
+    texts = get_survey_texts()
+
+    for text in texts:
+        await post_update(client, build_message(telegram_id, text))
+
+    payment_id = fakes.payment_ids_by_user[telegram_id]
+    await post_update(
+        client,
+        build_callback_query(ADMIN_CHAT_ID, f"update_payment;accept;{payment_id}"),
+    )
+
+    return len(texts) + 1
@@ -0,0 +1,85 @@
+import argparse
+import asyncio
+import subprocess
+import sys
+from typing import NamedTuple
+
+from .environment import ADMIN_CHAT_ID, configure_environment
+from .fakes import FakeServices
+from .harness import start_harness
+
+IMPORT_TARGET = "telegram_bot_service.main"
+
+
+class ImportTime(NamedTuple):
+    name: str
+    self_us: int
+    cumulative_us: int
+
+
+def profile_imports() -> list[ImportTime]:
+    # a fresh interpreter, modules imported by this process would be missing
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {IMPORT_TARGET}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    modules = []
+
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+
+        self_time, cumulative, name = line.removeprefix("import time:").split("|")
+
+        if self_time.strip().isdigit():
+            modules.append(ImportTime(name.strip(), int(self_time), int(cumulative)))
+
+    return modules
+
+
+async def measure_startup_phases() -> dict[str, float]:
+    async with start_harness():
+        from telegram_bot_service.metrics import startup_phase_duration
+
+        return {
+            labels[0]: value for labels, value in startup_phase_duration.values.items()
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=f"Profile the imports of {IMPORT_TARGET} and the startup phases"
+    )
+    parser.add_argument("--limit", type=int, default=25)
+    arguments = parser.parse_args()
+
+    # the fakes are not started, their urls only have to make settings valid
+    configure_environment(FakeServices(), [ADMIN_CHAT_ID])
+    modules = profile_imports()
+
+    total = next(
+        module.cumulative_us for module in modules if module.name == IMPORT_TARGET
+    )
+    print(f"import {IMPORT_TARGET}: {total / 1000:.1f} ms")
+
+    for title, field in (("cumulative", "cumulative_us"), ("self", "self_us")):
+        print(f"\n{'module':<60}{f'{title} ms':>15}")
+
+        slowest = sorted(
+            modules, key=lambda module: getattr(module, field), reverse=True
+        )
+
+        for module in slowest[: arguments.limit]:
+            print(f"{module.name:<60}{getattr(module, field) / 1000:>15.1f}")
+
+    print(f"\n{'phase':<60}{'ms':>15}")
+
+    for phase, seconds in asyncio.run(measure_startup_phases()).items():
+        print(f"{phase:<60}{seconds * 1000:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
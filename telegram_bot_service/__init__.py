@@ -1,28 +1,116 @@
+import asyncio
+import time
 from contextlib import asynccontextmanager
+from logging import getLogger
 from logging.config import dictConfig
-from typing import AsyncGenerator
+from typing import Any, AsyncGenerator, Awaitable
 
 from fastapi import FastAPI
 
+from .backend import close_backend_services
+from .broadcast import broadcaster
+from .config import settings
+from .funnel import funnel_recorder
 from .handlers import register_handlers
+from .handlers.error_handler import error_aggregator
+from .health import warm_up
+from .jobs import job_runner
 from .logging import LogConfig
-from .routes import router
+from .metrics import startup_phase_duration
+from .notifications import notification_retrier
+from .payment_expiry import payment_expirer
+from .polling import poller
+from .recording import recorder
+from .routes import admin_router, monitoring_router, router
+from .statistics import statistics
 from .telegram import telegram_application
+from .tracing import exporter
+from .updates import tracker
+
+logger = getLogger("service")
+
+
+def get_remaining(deadline: float) -> float:
+    return max(deadline - time.monotonic(), 0)
+
+
+async def wait_until(awaitable: Awaitable[Any], deadline: float, name: str) -> None:
+    try:
+        await asyncio.wait_for(awaitable, get_remaining(deadline))
+    except asyncio.TimeoutError:
+        logger.warning(f"Shutdown step {name} did not finish in time")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
-    await telegram_application.initialize()
+    with startup_phase_duration.time("startup"):
+        with startup_phase_duration.time("initialize"):
+            await telegram_application.initialize()
+
+        # webhooks are only accepted after startup, a warm-up that takes longer
+        # goes on in the background while readiness reports not ready
+        warm_up_task = asyncio.create_task(warm_up())
+
+        with startup_phase_duration.time("warm_up"):
+            await asyncio.wait({warm_up_task}, timeout=settings.startup_warm_up_timeout)
+
+    if settings.telegram_update_mode == "polling":
+        poller.start()
+
+    notification_retrier.start()
+    payment_expirer.start()
+    statistics.start()
+
+    if settings.recording_enabled:
+        recorder.start()
+
+    if settings.funnel_enabled:
+        funnel_recorder.start()
+
+    broadcaster.watch()
+
     yield
-    await telegram_application.shutdown()
+
+    warm_up_task.cancel()
+
+    logger.info("Draining in-flight updates")
+
+    # one budget for the whole drain, each step gets what the previous ones left
+    deadline = time.monotonic() + settings.shutdown_drain_timeout
+
+    await poller.stop(timeout=get_remaining(deadline))
+    await broadcaster.stop()
+    await job_runner.stop()
+    await payment_expirer.stop()
+
+    if abandoned := await tracker.drain(timeout=get_remaining(deadline)):
+        logger.warning(f"Abandoned {len(abandoned)} in-flight updates: {abandoned}")
+
+    await notification_retrier.stop(timeout=get_remaining(deadline))
+
+    # the cleanup has its own short budget, so it still runs after a long drain
+    deadline = time.monotonic() + settings.shutdown_cleanup_timeout
+
+    await wait_until(statistics.stop(), deadline, "statistics")
+    await wait_until(funnel_recorder.stop(), deadline, "funnel events")
+    await wait_until(error_aggregator.flush(digest=True), deadline, "error reports")
+    await wait_until(telegram_application.shutdown(), deadline, "bot shutdown")
+    await wait_until(close_backend_services(), deadline, "backend clients")
+    await wait_until(exporter.flush(), deadline, "trace export")
+    await wait_until(recorder.stop(), deadline, "update recording")
+
+    logger.info("Drained")
 
 
 def build_app() -> FastAPI:
-    app = FastAPI(lifespan=lifespan)
-    app.include_router(router)
+    with startup_phase_duration.time("build_app"):
+        app = FastAPI(lifespan=lifespan)
+        app.include_router(router)
+        app.include_router(monitoring_router)
+        app.include_router(admin_router)
 
-    dictConfig(LogConfig().dict())
+        dictConfig(LogConfig().dict())
 
-    register_handlers(telegram_application)
+        register_handlers(telegram_application)
 
     return app
@@ -1,21 +1,179 @@
+import json
+import time
+from enum import Enum
 from logging import getLogger
 
-from redis import Redis
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Message
 from telegram.error import TelegramError
 
 from .config import settings
 from .payment import Payment, PaymentStatus, update_payment
+from .storage import create_redis
 from .training_plan import TrainingPlan
 
 logger = getLogger("service")
 
-notification_redis = Redis(
-    host=settings.redis_host,
-    port=settings.redis_port,
-    db=settings.redis_admin_notification_db,
-    decode_responses=True,
-)
+notification_redis = create_redis(settings.redis_admin_notification_db)
+
+PENDING_PAYMENTS_KEY = "pending_payments"
+
+
+def get_pending_payment_key(payment_id: str) -> str:
+    return f"pending:{payment_id}"
+
+
+def get_pending_snapshot_key(chat_id: int) -> str:
+    return f"pending_snapshot:{chat_id}"
+
+
+def add_pending_payment(
+    payment: Payment, training_plan: TrainingPlan, telegram_id: int
+) -> None:
+    submitted_at = time.time()
+
+    with notification_redis.pipeline() as pipeline:
+        pipeline.zadd(PENDING_PAYMENTS_KEY, {payment.id: submitted_at})
+        pipeline.hset(
+            get_pending_payment_key(payment.id),
+            mapping={
+                "telegram_id": telegram_id,
+                "title": training_plan.title,
+                "url": training_plan.url,
+                "price": training_plan.price,
+                "submitted_at": submitted_at,
+            },
+        )
+        pipeline.execute()
+
+
+def remove_pending_payment(payment_id: str) -> None:
+    with notification_redis.pipeline() as pipeline:
+        pipeline.zrem(PENDING_PAYMENTS_KEY, payment_id)
+        pipeline.delete(get_pending_payment_key(payment_id))
+        pipeline.execute()
+
+
+def get_pending_snapshot(chat_id: int) -> tuple[int, list[str]] | None:
+    # the page the chat last saw and its offset, positions refer to it
+    if (
+        raw_snapshot := notification_redis.get(get_pending_snapshot_key(chat_id))
+    ) is None:
+        return None
+
+    snapshot = json.loads(raw_snapshot)
+    return snapshot["offset"], snapshot["payment_ids"]
+
+
+def get_pending_payments(
+    chat_id: int, offset: int, limit: int
+) -> tuple[int, list[dict[str, str]]]:
+    # oldest first, so the backlog is reviewed in submission order
+    with notification_redis.pipeline() as pipeline:
+        pipeline.zcard(PENDING_PAYMENTS_KEY)
+        pipeline.zrange(PENDING_PAYMENTS_KEY, offset, offset + limit - 1)
+        total, payment_ids = pipeline.execute()
+
+    with notification_redis.pipeline() as pipeline:
+        pipeline.set(
+            get_pending_snapshot_key(chat_id),
+            json.dumps({"offset": offset, "payment_ids": payment_ids}),
+            ex=settings.pending_payments_snapshot_ttl,
+        )
+
+        for payment_id in payment_ids:
+            pipeline.hgetall(get_pending_payment_key(payment_id))
+
+        _, *infos = pipeline.execute()
+
+    payments = [
+        {"id": payment_id, **info} for payment_id, info in zip(payment_ids, infos)
+    ]
+
+    return total, payments
+
+
+def get_notification_chats() -> list[tuple[int, int | None]]:
+    # one post to the admin group is tracked and edited once,
+    # instead of one copy per admin chat
+    if settings.bot_admin_group_chat_id is not None:
+        return [(settings.bot_admin_group_chat_id, settings.bot_admin_group_topic_id)]
+
+    return [(admin_chat_id, None) for admin_chat_id in settings.bot_admin_chat_ids]
+
+
+class DecisionStage(Enum):
+    CLAIMED = "claimed"
+    UPDATED = "updated"
+    DONE = "done"
+
+
+def get_decision_key(payment_id: str) -> str:
+    return f"decision:{payment_id}"
+
+
+def get_decision_follow_up_key(payment_id: str) -> str:
+    return f"decision:{payment_id}:follow_up"
+
+
+def is_payment_submitted(payment_id: str) -> bool:
+    # a screenshot reached the admins or a decision was taken, it must not expire
+    return bool(
+        notification_redis.exists(
+            get_pending_payment_key(payment_id), get_decision_key(payment_id)
+        )
+    )
+
+
+def claim_payment_decision(
+    payment_id: str, action: str
+) -> tuple[str, DecisionStage] | None:
+    # returns None when the claim succeeded, otherwise the action already taken
+    # and how far it got; a claim whose status change never happened expires soon
+    if notification_redis.set(
+        get_decision_key(payment_id),
+        f"{action}:{DecisionStage.CLAIMED.value}",
+        nx=True,
+        ex=settings.payment_decision_claim_ttl,
+    ):
+        return None
+
+    if not (value := notification_redis.get(get_decision_key(payment_id))):
+        # released in the meantime, the next click can claim it
+        return action, DecisionStage.CLAIMED
+
+    # decisions stored without a stage predate the stages and are complete
+    decided_action, _, stage = value.partition(":")
+    return decided_action, DecisionStage(stage) if stage else DecisionStage.DONE
+
+
+def set_payment_decision_stage(
+    payment_id: str, action: str, stage: DecisionStage
+) -> None:
+    notification_redis.set(
+        get_decision_key(payment_id),
+        f"{action}:{stage.value}",
+        ex=settings.payment_decision_ttl,
+    )
+
+
+def release_payment_decision(payment_id: str) -> None:
+    notification_redis.delete(get_decision_key(payment_id))
+
+
+def claim_payment_follow_up(payment_id: str) -> bool:
+    # the user notification and the admin message edits run in one place at a time
+    return bool(
+        notification_redis.set(
+            get_decision_follow_up_key(payment_id),
+            1,
+            nx=True,
+            ex=settings.payment_decision_claim_ttl,
+        )
+    )
+
+
+def release_payment_follow_up(payment_id: str) -> None:
+    notification_redis.delete(get_decision_follow_up_key(payment_id))
 
 
 async def notify_individual_plan(
@@ -44,14 +202,21 @@ async def notify_individual_plan(
         ]
     )
 
+    # indexed before the copies go out, so a decision taken on one of them
+    # removes the entry instead of running before it is added
+    add_pending_payment(payment, training_plan, user.id)  # type: ignore [union-attr]
+
     # str | bytes makes message_ids compatible
     # with mapping parameter in hset function
     message_ids: dict[str | bytes, int] = {}
 
-    for admin_chat_id in settings.bot_admin_chat_ids:
+    for admin_chat_id, topic_id in get_notification_chats():
         try:
             message = await media_message.copy(
-                chat_id=admin_chat_id, caption=caption, reply_markup=reply_markup
+                chat_id=admin_chat_id,
+                message_thread_id=topic_id,  # type: ignore [arg-type]
+                caption=caption,
+                reply_markup=reply_markup,
             )
             message_ids[str(admin_chat_id)] = message.message_id
 
@@ -63,6 +228,10 @@ async def notify_individual_plan(
                 exc_info=exc,
             )
 
-    notification_redis.hset(str(payment.id), mapping=message_ids)
+    if message_ids:
+        notification_redis.hset(str(payment.id), mapping=message_ids)
+    else:
+        # the pending index is then the only way admins find the payment
+        logger.error(f"No admin was notified of payment {payment.id}, see /pending")
 
     await update_payment(payment_id=payment.id, new_status=PaymentStatus.PROCESSING)
@@ -0,0 +1,291 @@
+import asyncio
+import random
+import ssl
+import time
+from collections import deque
+from enum import Enum
+from functools import cache
+from logging import getLogger
+from typing import Any
+
+import httpx
+from fastapi import status
+
+from .config import settings
+from .metrics import (
+    backend_circuit_state,
+    backend_request_duration,
+    backend_request_errors,
+)
+from .tracing import start_span
+
+logger = getLogger("service")
+
+
+class CircuitState(Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_progress = False
+        # bumped on every state change, outcomes of requests admitted
+        # in an earlier state are ignored
+        self.generation = 0
+
+    def admit(self) -> tuple[int, bool]:
+        # returns the generation the request was admitted in and whether
+        # it is the half-open trial
+        if self.state == CircuitState.CLOSED:
+            return self.generation, False
+
+        if self.state == CircuitState.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                raise CircuitOpenError(f"{self.name} circuit breaker is open")
+
+            self._set_state(CircuitState.HALF_OPEN)
+
+        # only one trial request is let through while half-open
+        if self.trial_in_progress:
+            raise CircuitOpenError(f"{self.name} circuit breaker is open")
+
+        self.trial_in_progress = True
+        return self.generation, True
+
+    def record_success(self, generation: int) -> None:
+        if generation != self.generation:
+            return
+
+        self.failures = 0
+
+        if self.state != CircuitState.CLOSED:
+            self._set_state(CircuitState.CLOSED)
+
+    def record_failure(self, generation: int) -> None:
+        if generation != self.generation:
+            return
+
+        self.failures += 1
+
+        if (
+            self.state == CircuitState.HALF_OPEN
+            or self.failures >= self.failure_threshold
+        ):
+            self.opened_at = time.monotonic()
+            self._set_state(CircuitState.OPEN)
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "state": self.state.value,
+            "failures": self.failures,
+            "open_for": (
+                time.monotonic() - self.opened_at
+                if self.state != CircuitState.CLOSED
+                else None
+            ),
+        }
+
+    def _set_state(self, state: CircuitState) -> None:
+        logger.warning(
+            f"Circuit breaker {self.name}: {self.state.value} -> {state.value}"
+        )
+        self.state = state
+        self.generation += 1
+
+
+@cache
+def get_ssl_context() -> ssl.SSLContext:
+    # loading the CA bundle takes tens of milliseconds, clients share one context
+    return httpx.create_ssl_context()
+
+
+class BackendService:
+    def __init__(
+        self, name: str, url: str, timeout: float, hedging: bool = False
+    ) -> None:
+        self.name = name
+        self.url = url
+        self.timeout = timeout
+        self.hedging = hedging
+
+        self.breaker = CircuitBreaker(
+            name,
+            failure_threshold=settings.backend_failure_threshold,
+            reset_timeout=settings.backend_reset_timeout,
+        )
+        self.latencies: deque[float] = deque(maxlen=settings.backend_latency_window)
+
+        self._client: httpx.AsyncClient | None = None
+
+        services[name] = self
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.url, timeout=self.timeout, verify=get_ssl_context()
+            )
+
+        return self._client
+
+    def latency_percentile(self, percentile: float) -> float | None:
+        if len(self.latencies) < settings.backend_hedge_min_samples:
+            return None
+
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile))]
+
+    async def request(self, method: str, path: str, **kwargs: Any) -> httpx.Response:
+        generation, trial = self.breaker.admit()
+
+        # only idempotent requests are safe to retry or hedge
+        idempotent = method == "GET"
+        attempts = 1 + (settings.backend_retries if idempotent else 0)
+
+        try:
+            for attempt in range(attempts):
+                if attempt:
+                    await asyncio.sleep(
+                        random.uniform(0, settings.backend_retry_backoff * 2**attempt)
+                    )
+
+                try:
+                    if idempotent and self.hedging:
+                        response = await self._hedged_send(method, path, **kwargs)
+                    else:
+                        response = await self._send(method, path, **kwargs)
+
+                except httpx.TransportError as exc:
+                    logger.warning(f"{self.name} {method} {path} failed: {exc!r}")
+
+                    if attempt + 1 == attempts:
+                        self.breaker.record_failure(generation)
+                        raise
+
+                    continue
+
+                if response.status_code < status.HTTP_500_INTERNAL_SERVER_ERROR:
+                    break
+
+                logger.warning(
+                    f"{self.name} {method} {path} returned {response.status_code}"
+                )
+
+        finally:
+            # a finished or cancelled trial lets the next one through, requests
+            # admitted before the breaker opened leave the flag alone
+            if trial:
+                self.breaker.trial_in_progress = False
+
+        if response.status_code < status.HTTP_500_INTERNAL_SERVER_ERROR:
+            self.breaker.record_success(generation)
+        else:
+            self.breaker.record_failure(generation)
+
+        return response
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+
+    async def _send(self, method: str, path: str, **kwargs: Any) -> httpx.Response:
+        started = time.perf_counter()
+
+        try:
+            with start_span(f"{self.name} {method}", path=path) as span:
+                response = await self.client.request(method, path, **kwargs)
+
+                if span:
+                    span.attributes["status_code"] = response.status_code
+
+        except httpx.TransportError:
+            backend_request_errors.inc(self.name)
+            raise
+
+        latency = time.perf_counter() - started
+        backend_request_duration.observe(latency, self.name, method)
+
+        # the hedge delay and the readiness probe go by reads, long writes
+        # like the plan fetch would push them up
+        if method == "GET":
+            self.latencies.append(latency)
+
+        if response.status_code >= status.HTTP_500_INTERNAL_SERVER_ERROR:
+            backend_request_errors.inc(self.name)
+
+        return response
+
+    async def _hedged_send(
+        self, method: str, path: str, **kwargs: Any
+    ) -> httpx.Response:
+        if (delay := self.latency_percentile(0.95)) is None:
+            return await self._send(method, path, **kwargs)
+
+        pending = {asyncio.ensure_future(self._send(method, path, **kwargs))}
+        error: BaseException | None = None
+
+        # a cancelled caller takes both the primary and the hedge down with it
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED
+                )
+
+                if not done:
+                    logger.debug(
+                        f"{self.name} {method} {path} exceeded p95, sending hedge"
+                    )
+                    pending.add(
+                        asyncio.ensure_future(self._send(method, path, **kwargs))
+                    )
+                    delay = None
+                    continue
+
+                for task in done:
+                    if (error := task.exception()) is None:
+                        return task.result()
+
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise error  # type: ignore [misc]
+
+
+services: dict[str, BackendService] = {}
+
+CIRCUIT_STATE_VALUES = {
+    CircuitState.CLOSED: 0,
+    CircuitState.HALF_OPEN: 1,
+    CircuitState.OPEN: 2,
+}
+
+
+def get_circuit_breaker_states() -> dict[str, dict[str, Any]]:
+    return {name: service.breaker.snapshot() for name, service in services.items()}
+
+
+async def close_backend_services() -> None:
+    for service in services.values():
+        await service.close()
+
+
+backend_circuit_state.set_function(
+    lambda: {
+        (name,): CIRCUIT_STATE_VALUES[service.breaker.state]
+        for name, service in services.items()
+    }
+)
@@ -0,0 +1,294 @@
+import asyncio
+import time
+from datetime import timedelta
+from logging import getLogger
+
+from telegram.error import Forbidden, RetryAfter, TelegramError
+
+from .config import settings
+from .metrics import broadcast_messages
+from .storage import Lease, service_redis
+from .telegram import telegram_application
+from .user import get_users
+
+logger = getLogger("service")
+
+BROADCAST_KEY = "broadcast"
+DELIVERED_KEY = "broadcast:delivered"
+BLOCKED_KEY = "broadcast:blocked"
+CANCELLED_KEY = "broadcast:cancelled"
+LEASE_KEY = "broadcast:lease"
+
+COUNTERS = ("offset", "sent", "blocked", "skipped", "failed")
+
+
+def unmark_blocked_user(telegram_id: int) -> None:
+    service_redis.srem(BLOCKED_KEY, telegram_id)
+
+
+class Broadcaster:
+    def __init__(self) -> None:
+        self.task: asyncio.Task[None] | None = None
+        self.watcher: asyncio.Task[None] | None = None
+
+        # only the process holding the lease sends, the others wait to resume
+        self.lease = Lease(service_redis, LEASE_KEY, settings.broadcast_lease_ttl)
+
+        self.semaphore = asyncio.Semaphore(settings.broadcast_concurrency)
+        self.next_send_at = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def start(
+        self,
+        from_chat_id: int,
+        message_id: int,
+        admin_chat_id: int,
+        progress_message_id: int,
+    ) -> bool:
+        if self.running or not self.lease.acquire():
+            return False
+
+        service_redis.delete(DELIVERED_KEY, CANCELLED_KEY)
+        service_redis.hset(
+            BROADCAST_KEY,
+            mapping={
+                "from_chat_id": from_chat_id,
+                "message_id": message_id,
+                "admin_chat_id": admin_chat_id,
+                "progress_message_id": progress_message_id,
+                "total": "",
+                **{counter: 0 for counter in COUNTERS},
+            },
+        )
+
+        self.task = asyncio.create_task(self.run())
+
+        return True
+
+    def resume(self) -> bool:
+        if self.running or not service_redis.exists(BROADCAST_KEY):
+            return False
+
+        if not self.lease.acquire():
+            return False
+
+        self.task = asyncio.create_task(self.run())
+
+        return True
+
+    def watch(self) -> None:
+        self.watcher = asyncio.create_task(self.resume_interrupted())
+
+    async def resume_interrupted(self) -> None:
+        # a broadcast left by a stopped process is picked up once its lease expires
+        while True:
+            try:
+                if self.resume():
+                    logger.info("Resumed interrupted broadcast")
+            except Exception as exc:
+                logger.error("Unable to resume broadcast", exc_info=exc)
+
+            await asyncio.sleep(settings.broadcast_lease_ttl)
+
+    def cancel(self) -> bool:
+        # the flag is shared, the process running the broadcast may be another one
+        if not service_redis.exists(BROADCAST_KEY):
+            return False
+
+        service_redis.set(CANCELLED_KEY, 1, ex=settings.job_ttl)
+        return True
+
+    async def stop(self) -> None:
+        # progress is checkpointed after every page, the job resumes on start
+        for task in (self.watcher, self.task):
+            if task is None or task.done():
+                continue
+
+            task.cancel()
+
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def renew_lease(self) -> None:
+        renewed = time.monotonic()
+
+        while True:
+            await asyncio.sleep(settings.broadcast_lease_ttl / 3)
+
+            try:
+                if not self.lease.renew():
+                    break
+            except Exception as exc:
+                logger.warning(f"Unable to renew broadcast lease: {exc!r}")
+
+                if time.monotonic() - renewed < settings.broadcast_lease_ttl:
+                    continue
+
+                break
+
+            renewed = time.monotonic()
+
+        # another process may already be sending, this one must not go on
+        logger.warning("Broadcast lease lost, stopping")
+        self.task.cancel()  # type: ignore [union-attr]
+
+    async def run(self) -> None:
+        renewal = asyncio.create_task(self.renew_lease())
+
+        try:
+            await self.broadcast()
+        finally:
+            renewal.cancel()
+
+            try:
+                self.lease.release()
+            except Exception as exc:
+                logger.warning(f"Unable to release broadcast lease: {exc!r}")
+
+    async def broadcast(self) -> None:
+        # the job may have been finished by the previous lease holder
+        if not (job := service_redis.hgetall(BROADCAST_KEY)):
+            return
+
+        # str | bytes makes progress compatible
+        # with mapping parameter in hset function
+        progress: dict[str | bytes, int] = {
+            counter: int(job[counter]) for counter in COUNTERS
+        }
+        total = int(job["total"]) if job["total"] else None
+
+        started, started_offset = time.monotonic(), progress["offset"]
+        reported = started
+
+        logger.info(f"Broadcasting from offset {progress['offset']}")
+
+        while not (cancelled := bool(service_redis.exists(CANCELLED_KEY))):
+            try:
+                users, total = await get_users(
+                    progress["offset"], settings.broadcast_page_size
+                )
+            except Exception as exc:
+                logger.error("Unable to get broadcast recipients", exc_info=exc)
+                await asyncio.sleep(settings.broadcast_retry_delay)
+                continue
+
+            if not users:
+                break
+
+            telegram_ids = [user.telegram_id for user in users]
+            blocked = service_redis.smismember(BLOCKED_KEY, telegram_ids)
+            delivered = service_redis.smismember(DELIVERED_KEY, telegram_ids)
+
+            # delivered ids are left over from a page interrupted by a restart
+            recipients = [
+                telegram_id
+                for telegram_id, is_blocked, is_delivered in zip(
+                    telegram_ids, blocked, delivered
+                )
+                if not is_blocked and not is_delivered
+            ]
+            progress["sent"] += sum(delivered)
+            progress["skipped"] += sum(blocked)
+
+            for result in await asyncio.gather(
+                *(self.send(job, telegram_id) for telegram_id in recipients)
+            ):
+                progress[result] += 1
+
+            progress["offset"] += len(users)
+
+            with service_redis.pipeline() as pipeline:
+                pipeline.hset(BROADCAST_KEY, mapping=progress)
+                pipeline.hset(BROADCAST_KEY, "total", "" if total is None else total)
+                pipeline.delete(DELIVERED_KEY)
+                pipeline.execute()
+
+            if time.monotonic() - reported >= settings.broadcast_progress_interval:
+                reported = time.monotonic()
+                rate = (progress["offset"] - started_offset) / (reported - started)
+
+                await self.report(job, progress, total, rate)
+
+        title = "Розсилку скасовано" if cancelled else "Розсилку завершено"
+        await self.report(job, progress, total, title=title)
+
+        logger.info(f"{title}: {progress}")
+        service_redis.delete(BROADCAST_KEY, DELIVERED_KEY, CANCELLED_KEY)
+
+    async def send(self, job: dict[str, str], telegram_id: int) -> str:
+        async with self.semaphore:
+            for _ in range(settings.broadcast_max_attempts):
+                await self.pace()
+
+                try:
+                    await telegram_application.bot.copy_message(
+                        chat_id=telegram_id,
+                        from_chat_id=job["from_chat_id"],
+                        message_id=int(job["message_id"]),
+                    )
+
+                except RetryAfter as exc:
+                    # every sender backs off, not only the one that hit the limit
+                    self.next_send_at = time.monotonic() + exc.retry_after
+                    continue
+
+                except Forbidden:
+                    service_redis.sadd(BLOCKED_KEY, telegram_id)
+                    broadcast_messages.inc("blocked")
+                    return "blocked"
+
+                except TelegramError as exc:
+                    logger.warning(f"Unable to broadcast to {telegram_id}: {exc!r}")
+                    break
+
+                service_redis.sadd(DELIVERED_KEY, telegram_id)
+                broadcast_messages.inc("sent")
+                return "sent"
+
+        broadcast_messages.inc("failed")
+        return "failed"
+
+    async def pace(self) -> None:
+        now = time.monotonic()
+        send_at = max(self.next_send_at, now)
+        self.next_send_at = send_at + 1 / settings.broadcast_rate
+
+        await asyncio.sleep(send_at - now)
+
+    async def report(
+        self,
+        job: dict[str, str],
+        progress: dict[str | bytes, int],
+        total: int | None,
+        rate: float | None = None,
+        title: str = "Розсилка триває",
+    ) -> None:
+        lines = [
+            title,
+            f"Оброблено: {progress['offset']} з {total if total is not None else '?'}",
+            f"Надіслано: {progress['sent']}",
+            f"Заблокували бота: {progress['blocked']}",
+            f"Пропущено: {progress['skipped']}",
+            f"Помилки: {progress['failed']}",
+        ]
+
+        if rate and total is not None:
+            eta = timedelta(seconds=int(max(total - progress["offset"], 0) / rate))
+            lines.append(f"Залишилось: ~{eta}")
+
+        try:
+            await telegram_application.bot.edit_message_text(
+                chat_id=job["admin_chat_id"],
+                message_id=int(job["progress_message_id"]),
+                text="\n".join(lines),
+            )
+        except TelegramError as exc:
+            logger.warning(f"Unable to report broadcast progress: {exc!r}")
+
+
+broadcaster = Broadcaster()
@@ -1,31 +1,174 @@
-from pydantic import BaseSettings
+from typing import Any, Literal
+
+from pydantic import BaseSettings, root_validator
+
+RECORDING_SALT_PLACEHOLDER = "change-me-to-a-long-random-secret"
 
 
 class Settings(BaseSettings):
     telegram_bot_token: str
     telegram_webhook_token: str
+    telegram_api_base_url: str = "https://api.telegram.org/bot"
+    telegram_update_mode: Literal["webhook", "polling"] = "webhook"
+
+    startup_warm_up_timeout: float = 10
+
+    polling_limit: int = 100
+    polling_timeout: int = 30
+    polling_concurrency: int = 16
+    polling_retry_delay: float = 5
+    polling_max_retry_delay: float = 60
 
     redis_host: str
     redis_port: int
 
     redis_language_db: int
     redis_admin_notification_db: int
+    redis_service_db: int = 2
 
     user_service_url: str
     user_service_timeout: int
 
     training_plan_service_url: str
     training_plan_service_timeout: int
+    training_plan_fetch_timeout: float = 600
+    training_plan_cache_size: int = 1024
+    training_plan_cache_ttl: int = 60 * 60
+    training_plan_generation_ttl: float = 5
 
     payment_service_url: str
     payment_service_timeout: int
 
+    backend_retries: int = 2
+    backend_retry_backoff: float = 0.2
+    backend_failure_threshold: int = 5
+    backend_reset_timeout: float = 30
+    backend_latency_window: int = 200
+    backend_hedge_min_samples: int = 20
+    training_plan_service_hedging: bool = False
+
+    tracing_enabled: bool = False
+    tracing_sample_rate: float = 0.01
+    tracing_slow_threshold: float = 1
+    tracing_batch_size: int = 50
+    tracing_export_path: str | None = None
+    tracing_collector_url: str | None = None
+
+    profiling_enabled: bool = False
+    profiling_sample_rate: float = 0
+    profiling_threshold: float | None = None
+    profiling_stack_interval: float = 0.01
+    profiling_directory: str = "profiles"
+    profiling_max_files: int = 50
+
+    recording_enabled: bool = False
+    recording_directory: str = "recordings"
+    recording_salt: str = ""
+    recording_flush_size: int = 100
+    recording_file_updates: int = 100_000
+
+    lane_admin_concurrency: int = 16
+    lane_payment_concurrency: int = 32
+    lane_general_concurrency: int = 128
+
+    rate_limit_enabled: bool = True
+    rate_limit_reply: bool = True
+    rate_limit_message_rate: float = 1
+    rate_limit_message_burst: float = 10
+    rate_limit_callback_rate: float = 2
+    rate_limit_callback_burst: float = 10
+    rate_limit_max_users: int = 100_000
+    rate_limit_offender_window: float = 5 * 60
+
+    admin_api_token: str | None = None
+
+    shutdown_drain_timeout: float = 20
+    shutdown_cleanup_timeout: float = 5
+
+    broadcast_rate: float = 25
+    broadcast_concurrency: int = 8
+    broadcast_page_size: int = 100
+    broadcast_max_attempts: int = 3
+    broadcast_retry_delay: float = 5
+    broadcast_progress_interval: float = 10
+    broadcast_lease_ttl: float = 30
+
+    job_ttl: int = 7 * 24 * 60 * 60
+    job_report_interval: float = 15
+    job_lock_ttl: float = 60
+
+    stats_flush_interval: float = 10
+    stats_ttl: int = 400 * 24 * 60 * 60
+    stats_max_days: int = 90
+
+    funnel_enabled: bool = False
+    funnel_flush_interval: float = 2
+    funnel_step_ttl: int = 24 * 60 * 60
+    funnel_batch_size: int = 200
+    funnel_stream_max_length: int = 1_000_000
+    funnel_choice_length: int = 64
+    funnel_export_directory: str = "funnel"
+    funnel_export_page_size: int = 1000
+
+    model_validation: bool = False
+
+    health_probe_ttl: float = 5
+    health_probe_timeout: float = 2
+
+    error_report_window: float = 60
+    error_report_concurrency: int = 4
+    error_report_interval: float = 3
+    error_report_max_reports: int = 20
+
+    payment_decision_ttl: int = 30 * 24 * 60 * 60
+    payment_decision_claim_ttl: int = 60
+    payment_reminder_delay: float = 6 * 60 * 60
+    payment_expiry_delay: float = 48 * 60 * 60
+    payment_expiry_poll_interval: float = 30
+    payment_expiry_batch_size: int = 200
+    payment_expiry_concurrency: int = 16
+    payment_expiry_retry_delay: float = 5 * 60
+    payment_expiry_lease: float = 5 * 60
+    pending_payments_page_size: int = 10
+    pending_payments_snapshot_ttl: int = 24 * 60 * 60
+    bulk_decision_concurrency: int = 8
+    bulk_decision_reported_failures: int = 30
+
+    notification_retry_base_delay: float = 30
+    notification_retry_max_delay: float = 60 * 60
+    notification_retry_max_attempts: int = 8
+    notification_retry_poll_interval: float = 5
+    notification_retry_batch_size: int = 50
+    notification_retry_rate: float = 10
+    notification_retry_lease: float = 5 * 60
+    notification_dead_letter_size: int = 1000
+    notification_dead_letters_shown: int = 20
+
     bot_admin_chat_ids: list[int]
+    bot_admin_group_chat_id: int | None = None
+    bot_admin_group_topic_id: int | None = None
     bot_developer_chat_ids: list[int]
 
     log_level: str
     log_format: str
     log_date_format: str
 
+    @root_validator(skip_on_failure=True)
+    def require_recording_salt(cls, values: dict[str, Any]) -> dict[str, Any]:
+        if not values["recording_enabled"] and not values["funnel_enabled"]:
+            return values
+
+        # a short, missing or published salt makes hashed telegram ids easy to
+        # brute force
+        salt = values["recording_salt"]
+
+        if len(salt) < 16 or salt == RECORDING_SALT_PLACEHOLDER:
+            raise ValueError(
+                "RECORDING_ENABLED and FUNNEL_ENABLED require RECORDING_SALT, "
+                "a secret of at least 16 characters other than the placeholder"
+            )
+
+        return values
+
 
 settings = Settings()  # type: ignore [call-arg]
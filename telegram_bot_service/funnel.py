@@ -0,0 +1,196 @@
+import asyncio
+import gzip
+import json
+import time
+from datetime import datetime
+from enum import Enum
+from logging import getLogger
+from pathlib import Path
+
+from telegram import Update
+
+from .config import settings
+from .language import get_button_id
+from .recording import anonymize_id
+from .storage import service_redis
+
+logger = getLogger("service")
+
+FUNNEL_STREAM_KEY = "funnel:events"
+FUNNEL_EXPORTED_KEY = "funnel:exported"
+FUNNEL_ENTERED_KEY = "funnel:entered:{}"
+
+exports_directory = Path(settings.funnel_export_directory)
+
+
+def get_text_choice(text: str) -> str:
+    if text.startswith("/"):
+        return text.split()[0]
+
+    # only keyboard buttons are kept, anything else was typed by the user
+    return get_button_id(text) or "<text>"
+
+
+def get_choice(update: Update) -> str:
+    if update.callback_query:
+        # the data after the action holds payment ids and page numbers
+        choice = (update.callback_query.data or "").split(";")[0]
+    elif update.message and update.message.photo:
+        choice = "<photo>"
+    elif update.message and update.message.text:
+        choice = get_text_choice(update.message.text)
+    else:
+        choice = ""
+
+    return choice[: settings.funnel_choice_length]
+
+
+class FunnelRecorder:
+    def __init__(self) -> None:
+        self.buffer: list[dict[str | bytes, str]] = []
+
+        self.task: asyncio.Task[None] | None = None
+        self.full = asyncio.Event()
+
+    def record(
+        self,
+        update: Update,
+        telegram_id: int,
+        previous_state: Enum | None,
+        state: Enum | None,
+    ) -> None:
+        self.buffer.append(
+            {
+                "user": str(anonymize_id(telegram_id)),
+                "from": previous_state.name if previous_state else "",
+                "state": state.name if state else "",
+                "choice": get_choice(update),
+                "timestamp": f"{time.time():.3f}",
+            }
+        )
+
+        if len(self.buffer) >= settings.funnel_batch_size:
+            self.full.set()
+
+    async def flush(self) -> None:
+        events, self.buffer = self.buffer, []
+
+        # redis calls are blocking, a thread keeps them off the event loop
+        if events:
+            await asyncio.to_thread(self.write, events)
+
+    def write(self, events: list[dict[str | bytes, str]]) -> None:
+        # step timestamps live in redis, so the latency holds across workers,
+        # users who left the conversation no longer need theirs
+        with service_redis.pipeline(transaction=False) as pipeline:
+            for event in events:
+                key = FUNNEL_ENTERED_KEY.format(event["user"])
+
+                if event["state"]:
+                    pipeline.set(
+                        key, event["timestamp"], ex=settings.funnel_step_ttl, get=True
+                    )
+                else:
+                    pipeline.getdel(key)
+
+            entered_at = pipeline.execute()
+
+        for event, previous in zip(events, entered_at):
+            event["latency"] = (
+                f"{float(event['timestamp']) - float(previous):.3f}" if previous else ""
+            )
+
+        with service_redis.pipeline(transaction=False) as pipeline:
+            for event in events:
+                pipeline.xadd(
+                    FUNNEL_STREAM_KEY,
+                    event,
+                    maxlen=settings.funnel_stream_max_length,
+                    approximate=True,
+                )
+
+            pipeline.execute()
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.task:
+            self.task.cancel()
+
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+        try:
+            await self.flush()
+        except Exception as exc:
+            logger.error("Unable to flush funnel events", exc_info=exc)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self.full.wait(), timeout=settings.funnel_flush_interval
+                )
+            except asyncio.TimeoutError:
+                pass
+
+            self.full.clear()
+
+            try:
+                await self.flush()
+            except Exception as exc:
+                logger.error("Unable to flush funnel events", exc_info=exc)
+
+
+funnel_recorder = FunnelRecorder()
+
+
+def write_funnel_export() -> int:
+    last_id = service_redis.get(FUNNEL_EXPORTED_KEY) or "0-0"
+
+    exports_directory.mkdir(parents=True, exist_ok=True)
+    path = exports_directory / f"funnel-{datetime.now():%Y%m%d-%H%M%S}.jsonl.gz"
+    exported = 0
+
+    # pages are read and written one at a time, the stream is never held in memory
+    with gzip.open(path, "wt", encoding="utf-8") as file:
+        while events := service_redis.xrange(
+            FUNNEL_STREAM_KEY, f"({last_id}", count=settings.funnel_export_page_size
+        ):
+            for event_id, event in events:
+                file.write(json.dumps({"id": event_id, **event}) + "\n")
+
+            last_id = events[-1][0]
+            exported += len(events)
+
+    if not exported:
+        path.unlink()
+        return 0
+
+    service_redis.set(FUNNEL_EXPORTED_KEY, last_id)
+    logger.info(f"Exported {exported} funnel events to {path}")
+
+    return exported
+
+
+async def export_funnel_events() -> bool:
+    await asyncio.to_thread(write_funnel_export)
+    return True
+
+
+def list_funnel_exports() -> list[Path]:
+    if not exports_directory.is_dir():
+        return []
+
+    return sorted(
+        exports_directory.glob("funnel-*.jsonl.gz"),
+        key=lambda path: path.stat().st_mtime,
+        reverse=True,
+    )
+
+
+def get_funnel_export(name: str) -> Path | None:
+    return next((path for path in list_funnel_exports() if path.name == name), None)
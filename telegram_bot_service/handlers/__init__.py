@@ -2,6 +2,8 @@
 
 # pyright: reportOptionalMemberAccess=false
 
+from functools import wraps
+from typing import Any, Awaitable, Callable, Coroutine
 
 from telegram import Update
 from telegram.ext import (
@@ -13,9 +15,25 @@ from telegram.ext import (
     filters,
 )
 
+from ..metrics import LabelValues, conversations
 from ..types import TelegramApplication, Translate
 from ..user import User
-from .admin import fetch_plans, handle_dummy_inline_button, update_payment_button
+from .admin import (
+    approve_payments,
+    cancel_broadcast,
+    change_pending_payments_page,
+    export_funnel,
+    fetch_plans,
+    get_job_status,
+    get_stats,
+    handle_dummy_inline_button,
+    list_dead_letters,
+    list_pending_payments,
+    reject_payments,
+    replay_notifications,
+    start_broadcast,
+    update_payment_button,
+)
 from .constants import MenuState
 from .equipment_shop import send_equipment_shop_data
 from .error_handler import error_handler
@@ -86,60 +104,127 @@ async def handle_menu_button(
     return MenuState.MAIN_MENU
 
 
+# the states the conversation handlers returned, ConversationHandler
+# keeps its own copy private
+conversation_states: dict[tuple[int, int], MenuState] = {}
+
+
+def track_state(
+    callback: Callable[..., Awaitable[Any]]
+) -> Callable[..., Coroutine[Any, Any, Any]]:
+    @wraps(callback)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Any:
+        state = await callback(update, context)
+        key = (update.effective_chat.id, update.effective_user.id)
+
+        # None keeps the current state, like ConversationHandler does
+        if state == ConversationHandler.END:
+            conversation_states.pop(key, None)
+        elif isinstance(state, MenuState):
+            conversation_states[key] = state
+
+        return state
+
+    return wrapper
+
+
+def get_conversation_state(chat_id: int, user_id: int) -> MenuState | None:
+    return conversation_states.get((chat_id, user_id))
+
+
+def count_conversations() -> dict[LabelValues, float]:
+    counts: dict[LabelValues, float] = {}
+
+    for state in conversation_states.values():
+        counts[(state.name,)] = counts.get((state.name,), 0) + 1
+
+    return counts
+
+
 def register_handlers(telegram_application: TelegramApplication) -> None:
-    telegram_application.add_handler(
-        ConversationHandler(
-            entry_points=[
+    # an awaited screenshot is accepted outside the survey too, after a restart
+    # or going back to the main menu, save_payment_screenshot checks it in redis
+    conversation_handler = ConversationHandler(
+        entry_points=[
+            CommandHandler("start", send_main_menu),
+            MessageHandler(filters.TEXT & (~filters.COMMAND), handle_menu_button),
+            MessageHandler(filters.PHOTO, save_payment_screenshot),
+        ],
+        states={
+            MenuState.MAIN_MENU: [
                 CommandHandler("start", send_main_menu),
                 MessageHandler(filters.TEXT & (~filters.COMMAND), handle_menu_button),
+                MessageHandler(filters.PHOTO, save_payment_screenshot),
             ],
-            states={
-                MenuState.MAIN_MENU: [
-                    CommandHandler("start", send_main_menu),
-                    MessageHandler(
-                        filters.TEXT & (~filters.COMMAND), handle_menu_button
-                    ),
-                ],
-                MenuState.INDIVIDUAL_PLAN_START: [
-                    MessageHandler(filters.TEXT & (~filters.COMMAND), ask_sex)
-                ],
-                MenuState.SEX: [
-                    MessageHandler(filters.TEXT & (~filters.COMMAND), save_sex)
-                ],
-                MenuState.AGE_GROUP: [
-                    MessageHandler(filters.TEXT & (~filters.COMMAND), save_age_group)
-                ],
-                MenuState.HEALTH_CONDITION: [
-                    MessageHandler(
-                        filters.TEXT & (~filters.COMMAND), handle_health_condition
-                    )
-                ],
-                MenuState.GOAL: [
-                    MessageHandler(filters.TEXT & (~filters.COMMAND), save_goal)
-                ],
-                MenuState.ENVIRONMENT: [
-                    MessageHandler(filters.TEXT & (~filters.COMMAND), save_environment)
-                ],
-                MenuState.LEVEL: [
-                    MessageHandler(filters.TEXT & (~filters.COMMAND), save_level)
-                ],
-                MenuState.FREQUENCY: [
-                    MessageHandler(filters.TEXT & (~filters.COMMAND), save_frequency)
-                ],
-                MenuState.PAYMENT_SCREENSHOT: [
-                    MessageHandler(filters.ALL, save_payment_screenshot)
-                ],
-            },
-            fallbacks=[CommandHandler("start", send_main_menu)],
-        )
+            MenuState.INDIVIDUAL_PLAN_START: [
+                MessageHandler(filters.TEXT & (~filters.COMMAND), ask_sex)
+            ],
+            MenuState.SEX: [
+                MessageHandler(filters.TEXT & (~filters.COMMAND), save_sex)
+            ],
+            MenuState.AGE_GROUP: [
+                MessageHandler(filters.TEXT & (~filters.COMMAND), save_age_group)
+            ],
+            MenuState.HEALTH_CONDITION: [
+                MessageHandler(
+                    filters.TEXT & (~filters.COMMAND), handle_health_condition
+                )
+            ],
+            MenuState.GOAL: [
+                MessageHandler(filters.TEXT & (~filters.COMMAND), save_goal)
+            ],
+            MenuState.ENVIRONMENT: [
+                MessageHandler(filters.TEXT & (~filters.COMMAND), save_environment)
+            ],
+            MenuState.LEVEL: [
+                MessageHandler(filters.TEXT & (~filters.COMMAND), save_level)
+            ],
+            MenuState.FREQUENCY: [
+                MessageHandler(filters.TEXT & (~filters.COMMAND), save_frequency)
+            ],
+            MenuState.PAYMENT_SCREENSHOT: [
+                MessageHandler(filters.ALL, save_payment_screenshot)
+            ],
+        },
+        fallbacks=[CommandHandler("start", send_main_menu)],
     )
 
+    for handler in (
+        *conversation_handler.entry_points,
+        *(
+            handler
+            for handlers in conversation_handler.states.values()
+            for handler in handlers
+        ),
+        *conversation_handler.fallbacks,
+    ):
+        handler.callback = track_state(handler.callback)
+
+    telegram_application.add_handler(conversation_handler)
+    conversations.set_function(count_conversations)
+
     telegram_application.add_handler(CommandHandler("fetch_plans", fetch_plans))
+    telegram_application.add_handler(CommandHandler("job", get_job_status))
+    telegram_application.add_handler(CommandHandler("pending", list_pending_payments))
+    telegram_application.add_handler(CommandHandler("approve", approve_payments))
+    telegram_application.add_handler(CommandHandler("reject", reject_payments))
+    telegram_application.add_handler(CommandHandler("dead_letters", list_dead_letters))
+    telegram_application.add_handler(CommandHandler("replay", replay_notifications))
+    telegram_application.add_handler(CommandHandler("stats", get_stats))
+    telegram_application.add_handler(CommandHandler("export_funnel", export_funnel))
+    telegram_application.add_handler(CommandHandler("broadcast", start_broadcast))
+    telegram_application.add_handler(
+        CommandHandler("broadcast_cancel", cancel_broadcast)
+    )
 
     telegram_application.add_handler(
         CallbackQueryHandler(update_payment_button, pattern="^update_payment")
     )
 
+    telegram_application.add_handler(
+        CallbackQueryHandler(change_pending_payments_page, pattern="^pending_payments")
+    )
+
     telegram_application.add_handler(
         CallbackQueryHandler(handle_dummy_inline_button, pattern="^dummy")
     )
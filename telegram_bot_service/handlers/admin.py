@@ -2,16 +2,36 @@
 
 # pyright: reportOptionalMemberAccess=false
 
+import asyncio
+import html
+from datetime import datetime
 from logging import getLogger
 
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
-from telegram.constants import ChatAction
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.constants import ParseMode
 from telegram.error import TelegramError
 from telegram.ext import ContextTypes
 
-from ..admin import notification_redis
+from ..admin import (
+    DecisionStage,
+    claim_payment_decision,
+    claim_payment_follow_up,
+    get_pending_payments,
+    get_pending_snapshot,
+    notification_redis,
+    release_payment_decision,
+    release_payment_follow_up,
+    remove_pending_payment,
+    set_payment_decision_stage,
+)
+from ..broadcast import broadcaster
+from ..config import settings
+from ..funnel import export_funnel_events
+from ..jobs import job_runner
 from ..language import get_user_translation_function
-from ..payment import PaymentStatus, update_payment
+from ..notifications import defer_notification, get_dead_letters, replay_dead_letters
+from ..payment import Payment, PaymentStatus, update_payment
+from ..statistics import get_statistics, statistics
 from ..training_plan import fetch_training_plans, get_training_plan
 from .helpers import log_update_data, require_admin
 
@@ -26,110 +46,541 @@ ACTION_TO_STATUS = {
 @log_update_data
 @require_admin
 async def fetch_plans(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await update.message.reply_text("Оновлення планів тренувань розпочато")
-    await update.message.reply_chat_action(ChatAction.TYPING)
+    progress_message = await update.message.reply_text(
+        "Оновлення планів тренувань розпочато"
+    )
 
-    if await fetch_training_plans():
-        await update.message.reply_text("Оновлення завершено успішно")
+    job_id, started = job_runner.start(
+        "fetch_plans",
+        "Оновлення планів тренувань",
+        fetch_training_plans,
+        chat_id=update.effective_chat.id,
+        message_id=progress_message.message_id,
+    )
+
+    # a started job reports its own progress into the message
+    if not started:
+        await progress_message.edit_text(
+            f"Оновлення планів тренувань вже триває, завдання {job_id}"
+        )
+
+
+@log_update_data
+@require_admin
+async def export_funnel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    progress_message = await update.message.reply_text("Експорт воронки розпочато")
+
+    job_id, started = job_runner.start(
+        "export_funnel",
+        "Експорт воронки",
+        export_funnel_events,
+        chat_id=update.effective_chat.id,
+        message_id=progress_message.message_id,
+    )
+
+    if not started:
+        await progress_message.edit_text(
+            f"Експорт воронки вже триває, завдання {job_id}"
+        )
+
+
+@log_update_data
+@require_admin
+async def get_job_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not context.args:
+        await update.message.reply_text("Вкажіть ідентифікатор завдання: /job <id>")
         return
 
-    await update.message.reply_text("Помилка при оновленні планів тренувань")
+    if not (text := job_runner.get_status(context.args[0])):
+        await update.message.reply_text("Завдання не знайдено")
+        return
+
+    await update.message.reply_text(text, parse_mode=None)
 
 
 @log_update_data
 @require_admin
-async def update_payment_button(
+async def get_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    days = int(context.args[0]) if context.args and context.args[0].isdigit() else 1
+    days = min(max(days, 1), settings.stats_max_days)
+
+    # this worker's buffered counts are included
+    await statistics.flush()
+    users, counters = get_statistics(days)
+
+    lines = [
+        f"Статистика за {days} дн.",
+        f"Унікальні користувачі: {users}",
+        f"Почали опитування: {counters['handler:start_training_plan_survey']}",
+        f"Створено оплат: {counters['payment:created']}",
+        f"Надіслано скріншотів: {counters['payment:submitted']}",
+        f"Підтверджено: {counters['payment:accepted']}",
+        f"Відхилено: {counters['payment:rejected']}",
+        f"Прострочено: {counters['payment:expired']}",
+    ]
+
+    for title, prefix in (("Переходи", "transition:"), ("Обробники", "handler:")):
+        entries = [
+            (name.removeprefix(prefix), count)
+            for name, count in counters.most_common()
+            if name.startswith(prefix)
+        ]
+
+        if entries:
+            lines.append(f"\n{title}:")
+            lines.extend(f"{name}: {count}" for name, count in entries)
+
+    await update.message.reply_text("\n".join(lines), parse_mode=None)
+
+
+@log_update_data
+@require_admin
+async def list_dead_letters(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    total, notifications = get_dead_letters(settings.notification_dead_letters_shown)
+
+    if not total:
+        await update.message.reply_text("Немає недоставлених повідомлень")
+        return
+
+    lines = [f"Недоставлені повідомлення: {total}"]
+
+    for notification in notifications:
+        lines.append(
+            f"{notification['id']}: користувач {notification['chat_id']}, "
+            f"спроб: {notification['attempts']}, {notification['error']}\n"
+            f"{notification['text'][:80]}"
+        )
+
+    lines.append("Повторити: /replay all або /replay <id> <id>")
+
+    await update.message.reply_text("\n".join(lines), parse_mode=None)
+
+
+@log_update_data
+@require_admin
+async def replay_notifications(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> None:
-    query = update.callback_query
+    if context.args == ["all"]:
+        replayed = replay_dead_letters()
 
-    if not query or not query.data:
+    elif context.args:
+        replayed = replay_dead_letters(context.args)
+
+    else:
+        await update.message.reply_text("Вкажіть id зі списку /dead_letters або all")
         return
 
-    await query.answer()
+    await update.message.reply_text(f"Повторно заплановано повідомлень: {replayed}")
 
-    _, action, payment_id = query.data.split(";")
 
-    status, message = ACTION_TO_STATUS[action]
-    payment = await update_payment(payment_id, status)
+@log_update_data
+@require_admin
+async def start_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not (source := update.message.reply_to_message):
+        await update.message.reply_text(
+            "Надішліть /broadcast у відповідь на повідомлення для розсилки"
+        )
+        return
+
+    progress_message = await update.message.reply_text("Розсилку розпочато")
 
-    if not payment:
+    # the lease is held by whichever process is sending, possibly not this one
+    if not broadcaster.start(
+        from_chat_id=source.chat_id,
+        message_id=source.message_id,
+        admin_chat_id=update.effective_chat.id,
+        progress_message_id=progress_message.message_id,
+    ):
+        await progress_message.edit_text("Розсилка вже триває")
+
+
+@log_update_data
+@require_admin
+async def cancel_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if broadcaster.cancel():
+        await update.message.reply_text("Розсилку буде скасовано")
         return
 
-    user_id = payment.user.telegram_id
-    translate = get_user_translation_function(user_id)
+    await update.message.reply_text("Немає активної розсилки")
 
-    if status == PaymentStatus.ACCEPTED:
-        training_plan = await get_training_plan(
-            (payment.items[0]).training_plan_id  # type: ignore [arg-type]
-        )
 
+async def edit_payment_notifications(bot: Bot, payment_id: str, message: str) -> None:
+    if not (raw_message_ids := notification_redis.hgetall(payment_id)):
+        return
+
+    async def edit_notification(chat_id: str, message_id: str) -> None:
         try:
-            await context.bot.send_message(
-                chat_id=user_id,
-                text=translate("training_plan_payment_accepted"),
+            await bot.edit_message_reply_markup(
+                chat_id=chat_id,
+                message_id=int(message_id),
                 reply_markup=InlineKeyboardMarkup(
-                    [
-                        [
-                            InlineKeyboardButton(
-                                translate("training_plan_url_button"),
-                                url=training_plan.content_url,
-                            )
-                        ]
-                    ]
+                    [[InlineKeyboardButton(message, callback_data="dummy")]]
                 ),
             )
 
-            logger.debug(f"Sent payment {payment_id} confirmation to {user_id}")
+            logger.debug(f"Updated payment {payment_id} message in chat {chat_id}")
 
         except TelegramError as exc:
             logger.error(
-                f"Unable to send payment {payment_id} confirmation to {user_id}",
+                f"Unable to update payment {payment_id} message in chat {chat_id}",
                 exc_info=exc,
             )
-            await update.effective_message.reply_text(
-                "Помилка відправки повідомлення про підтвердження користувачу",
-                quote=True,
-            )
-            return
 
-    elif status == PaymentStatus.REJECTED:
-        try:
-            await context.bot.send_message(
-                chat_id=user_id, text=translate("training_plan_payment_rejected")
-            )
+    await asyncio.gather(
+        *(
+            edit_notification(chat_id, message_id)
+            for chat_id, message_id in raw_message_ids.items()
+        )
+    )
 
-            logger.debug(f"Sent payment {payment_id} rejection to {user_id}")
+    notification_redis.hdel(payment_id, *raw_message_ids.keys())
 
-        except TelegramError as exc:
-            logger.error(
-                f"Unable to send payment {payment_id} rejection to {user_id}",
-                exc_info=exc,
-            )
-            await update.effective_message.reply_text(
-                "Помилка відправки повідомлення про відмову користувачу", quote=True
-            )
 
-    if raw_message_ids := notification_redis.hgetall(payment_id):
-        for chat_id, message_id in raw_message_ids.items():
+# returns the action to carry out and whether the payment status is already
+# changed, or why the decision is left to someone else
+def claim_decision(payment_id: str, action: str) -> tuple[str, bool] | str:
+    if not (decision := claim_payment_decision(payment_id, action)):
+        return action, False
+
+    decided_action, stage = decision
+
+    # the status was changed but the follow-ups failed, a repeated click retries them
+    if stage == DecisionStage.UPDATED and claim_payment_follow_up(payment_id):
+        return decided_action, True
+
+    if stage == DecisionStage.DONE:
+        return f"Оплату вже оброблено: {ACTION_TO_STATUS[decided_action][1]}"
+
+    return "Оплата вже обробляється"
+
+
+async def notify_payment_decision(
+    bot: Bot, payment: Payment, action: str
+) -> str | None:
+    status, _ = ACTION_TO_STATUS[action]
+
+    user_id = payment.user.telegram_id
+    translate = get_user_translation_function(user_id)
+
+    reply_markup = None
+
+    if status == PaymentStatus.ACCEPTED:
+        training_plan = await get_training_plan(
+            (payment.items[0]).training_plan_id  # type: ignore [arg-type]
+        )
+
+        text = translate("training_plan_payment_accepted")
+        reply_markup = InlineKeyboardMarkup(
+            [
+                [
+                    InlineKeyboardButton(
+                        translate("training_plan_url_button"),
+                        url=training_plan.content_url,
+                    )
+                ]
+            ]
+        )
+        description = "підтвердження"
+
+    else:
+        text = translate("training_plan_payment_rejected")
+        description = "відмову"
+
+    try:
+        await bot.send_message(chat_id=user_id, text=text, reply_markup=reply_markup)
+
+        logger.debug(f"Sent payment {payment.id} {description} to {user_id}")
+
+    except TelegramError as exc:
+        logger.error(
+            f"Unable to send payment {payment.id} {action} message to {user_id}",
+            exc_info=exc,
+        )
+
+        # the decision stands, the message is delivered later or kept for a replay
+        if defer_notification(user_id, text, exc, reply_markup):
+            outcome = "його буде надіслано повторно"
+        else:
+            outcome = "його додано до /dead_letters"
+
+        return (
+            f"Помилка відправки повідомлення про {description} користувачу, {outcome}"
+        )
+
+    return None
+
+
+# expects the decision to be claimed already, returns a description
+# of what went wrong for the admin or None when everything succeeded
+async def process_payment_decision(
+    bot: Bot, payment_id: str, action: str, updated: bool = False
+) -> str | None:
+    status, message = ACTION_TO_STATUS[action]
+
+    try:
+        # setting the same status again is harmless and returns the payment
+        # a retry of the follow-ups needs
+        payment = await update_payment(payment_id, status)
+    except Exception:
+        if updated:
+            release_payment_follow_up(payment_id)
+        else:
+            release_payment_decision(payment_id)
+
+        raise
+
+    if not updated:
+        claim_payment_follow_up(payment_id)
+        set_payment_decision_stage(payment_id, action, DecisionStage.UPDATED)
+
+        remove_pending_payment(payment_id)
+        statistics.increment(f"payment:{status.name.lower()}")
+
+    try:
+        error = await notify_payment_decision(bot, payment, action)
+        await edit_payment_notifications(bot, payment_id, message)
+
+        set_payment_decision_stage(payment_id, action, DecisionStage.DONE)
+
+    finally:
+        release_payment_follow_up(payment_id)
+
+    return error
+
+
+@log_update_data
+@require_admin
+async def update_payment_button(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> None:
+    query = update.callback_query
+
+    if not query or not query.data:
+        return
+
+    _, action, payment_id = query.data.split(";")
+
+    # the first admin to decide wins, repeated or redelivered clicks stop here
+    if isinstance(claim := claim_decision(payment_id, action), str):
+        await query.answer(claim)
+        return
+
+    await query.answer()
+
+    decided_action, updated = claim
+
+    if error := await process_payment_decision(
+        context.bot, payment_id, decided_action, updated
+    ):
+        await update.effective_message.reply_text(error, quote=True)
+
+
+def select_pending_payments(
+    offset: int, payment_ids: list[str], selection: list[str]
+) -> list[str] | None:
+    # selection is positions from the shown /pending page, single ones or ranges
+    selected: dict[str, None] = {}
+
+    for item in selection:
+        first, _, last = item.partition("-")
+
+        if not first.isdigit() or not (last or first).isdigit():
+            return None
+
+        # positions off the shown page are ignored, a huge range costs nothing
+        start = max(int(first), offset + 1)
+        stop = min(int(last or first), offset + len(payment_ids))
+
+        for position in range(start, stop + 1):
+            selected[payment_ids[position - offset - 1]] = None
+
+    return list(selected)
+
+
+async def decide_payments(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, action: str
+) -> None:
+    # positions and "all" refer to the page this chat saw, payments decided
+    # since then keep their numbers and ones submitted since then are left out
+    if (snapshot := get_pending_snapshot(update.effective_chat.id)) is None:
+        await update.message.reply_text("Спочатку відкрийте список /pending")
+        return
+
+    if context.args == ["all"]:
+        payment_ids: list[str] | None = snapshot[1]
+    else:
+        payment_ids = select_pending_payments(*snapshot, context.args or [])
+
+    if not context.args or payment_ids is None:
+        await update.message.reply_text(
+            "Вкажіть номери оплат зі списку /pending, наприклад 1 3 5-8, або all"
+        )
+        return
+
+    if not payment_ids:
+        await update.message.reply_text("Немає вибраних оплат на показаній сторінці")
+        return
+
+    status_text = ACTION_TO_STATUS[action][1]
+    progress_message = await update.message.reply_text(
+        f"Обробка {len(payment_ids)} оплат: {status_text}"
+    )
+
+    semaphore = asyncio.Semaphore(settings.bulk_decision_concurrency)
+
+    async def decide(payment_id: str) -> str | None:
+        async with semaphore:
+            if isinstance(claim := claim_decision(payment_id, action), str):
+                return claim
+
+            decided_action, updated = claim
+
+            # a decision whose follow-ups failed is retried by its own action,
+            # it is not counted as a success of the opposite one
+            if decided_action != action:
+                release_payment_follow_up(payment_id)
+                return f"Оплату вже оброблено: {ACTION_TO_STATUS[decided_action][1]}"
+
             try:
-                await context.bot.edit_message_reply_markup(
-                    chat_id=chat_id,
-                    message_id=int(message_id),
-                    reply_markup=InlineKeyboardMarkup(
-                        [[InlineKeyboardButton(message, callback_data="dummy")]]
-                    ),
+                return await process_payment_decision(
+                    context.bot, payment_id, decided_action, updated
                 )
+            except Exception as exc:
+                logger.error(f"Unable to process payment {payment_id}", exc_info=exc)
+                return f"помилка: {exc!r}"
 
-                logger.debug(f"Updated payment {payment_id} message in chat {chat_id}")
+    errors = await asyncio.gather(*(decide(payment_id) for payment_id in payment_ids))
+    failures = [
+        f"{payment_id}: {error}"
+        for payment_id, error in zip(payment_ids, errors)
+        if error
+    ]
 
-            except TelegramError as exc:
-                logger.error(
-                    f"Unable to update payment {payment_id} message in chat {chat_id}",
-                    exc_info=exc,
-                )
+    lines = [f"{status_text}: {len(payment_ids) - len(failures)} з {len(payment_ids)}"]
+
+    if failures:
+        lines.append("Не вдалося обробити:")
+        lines.extend(failures[: settings.bulk_decision_reported_failures])
+
+        if len(failures) > settings.bulk_decision_reported_failures:
+            lines.append(
+                f"та ще {len(failures) - settings.bulk_decision_reported_failures}"
+            )
+
+    # errors are arbitrary text, the default Markdown parse mode would reject them
+    await progress_message.edit_text("\n".join(lines), parse_mode=None)
+
+
+@log_update_data
+@require_admin
+async def approve_payments(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await decide_payments(update, context, "accept")
+
+
+@log_update_data
+@require_admin
+async def reject_payments(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await decide_payments(update, context, "reject")
+
+
+def get_pending_payments_page(
+    chat_id: int, page: int
+) -> tuple[str, InlineKeyboardMarkup]:
+    page_size = settings.pending_payments_page_size
+    total, payments = get_pending_payments(chat_id, page * page_size, page_size)
+
+    if not total:
+        return "Немає оплат, що очікують підтвердження", InlineKeyboardMarkup([])
+
+    pages = (total + page_size - 1) // page_size
+    lines = [f"<b>Очікують підтвердження: {total}</b> (сторінка {page + 1}/{pages})"]
+    keyboard = []
+
+    for number, payment in enumerate(payments, start=page * page_size + 1):
+        # decided by someone else between listing the ids and reading them,
+        # the number stays taken so the others match the snapshot
+        if "submitted_at" not in payment:
+            continue
+
+        submitted_at = datetime.fromtimestamp(float(payment["submitted_at"]))
+
+        lines.append(
+            f"{number}. <a href=\"{html.escape(payment['url'])}\">"
+            f"{html.escape(payment['title'])}</a>, {float(payment['price']):.2f} грн, "
+            f"<a href=\"tg://user?id={payment['telegram_id']}\">користувач</a>, "
+            f"{submitted_at:%d.%m %H:%M}"
+        )
+        keyboard.append(
+            [
+                InlineKeyboardButton(
+                    f"{number}: OK",
+                    callback_data=f"update_payment;accept;{payment['id']}",
+                ),
+                InlineKeyboardButton(
+                    f"{number}: не OK",
+                    callback_data=f"update_payment;reject;{payment['id']}",
+                ),
+            ]
+        )
+
+    navigation = []
+
+    if page > 0:
+        navigation.append(
+            InlineKeyboardButton("<<", callback_data=f"pending_payments;{page - 1}")
+        )
+
+    if page + 1 < pages:
+        navigation.append(
+            InlineKeyboardButton(">>", callback_data=f"pending_payments;{page + 1}")
+        )
+
+    if navigation:
+        keyboard.append(navigation)
+
+    return "\n".join(lines), InlineKeyboardMarkup(keyboard)
+
+
+@log_update_data
+@require_admin
+async def list_pending_payments(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> None:
+    page = int(context.args[0]) - 1 if context.args and context.args[0].isdigit() else 0
+    text, reply_markup = get_pending_payments_page(
+        update.effective_chat.id, max(page, 0)
+    )
+
+    await update.message.reply_text(
+        text,
+        parse_mode=ParseMode.HTML,
+        reply_markup=reply_markup,
+        disable_web_page_preview=True,
+    )
+
+
+@log_update_data
+@require_admin
+async def change_pending_payments_page(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> None:
+    query = update.callback_query
+
+    if not query or not query.data:
+        return
+
+    await query.answer()
+
+    _, page = query.data.split(";")
+    text, reply_markup = get_pending_payments_page(update.effective_chat.id, int(page))
 
-        notification_redis.hdel(payment_id, *raw_message_ids.keys())
+    await query.edit_message_text(
+        text,
+        parse_mode=ParseMode.HTML,
+        reply_markup=reply_markup,
+        disable_web_page_preview=True,
+    )
 
 
 async def handle_dummy_inline_button(
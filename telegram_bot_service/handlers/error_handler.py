@@ -1,25 +1,252 @@
+import asyncio
+import hashlib
 import html
 import json
+import time
 import traceback
+from dataclasses import dataclass
 from logging import getLogger
 
-from telegram import Update
-from telegram.constants import ParseMode
+from telegram import InputFile, Update
+from telegram.constants import MessageLimit, ParseMode
+from telegram.error import TelegramError
 from telegram.ext import ContextTypes
 
 from ..config import settings
+from ..telegram import telegram_application
 
 logger = getLogger("service")
 
+ERROR_DIGEST_TITLE_LENGTH = 150
+
+
+@dataclass
+class ErrorReport:
+    title: str
+    sections: list[str]
+
+    count: int = 1
+    first_seen: float = 0
+
+
+def get_fingerprint(error: BaseException) -> str:
+    frames = traceback.extract_tb(error.__traceback__)
+    stack = "|".join(
+        f"{frame.filename}:{frame.name}:{frame.lineno}" for frame in frames
+    )
+
+    return hashlib.sha1(f"{type(error).__name__}|{stack}".encode()).hexdigest()[:12]
+
+
+def truncate_escaped(text: str, length: int) -> str:
+    escaped = html.escape(text)
+
+    if len(escaped) <= length:
+        return escaped
+
+    escaped = escaped[: length - 1]
+
+    # an entity cut in half is rejected by the html parser
+    if (ampersand := escaped.rfind("&")) > escaped.rfind(";"):
+        escaped = escaped[:ampersand]
+
+    return f"{escaped}…"
+
+
+class ErrorAggregator:
+    def __init__(self) -> None:
+        # repeats of errors already reported in the current window
+        self.reports: dict[str, ErrorReport] = {}
+        self.reported: set[str] = set()
+        # first occurrences still waiting for their turn to be sent
+        self.sending: dict[asyncio.Task[None], tuple[str, ErrorReport]] = {}
+
+        self.flush_task: asyncio.Task[None] | None = None
+        self.semaphore = asyncio.Semaphore(settings.error_report_concurrency)
+        self.next_send_at: dict[int, float] = {}
+
+    def add(self, fingerprint: str, title: str, sections: list[str]) -> None:
+        if not self.flush_task:
+            self.flush_task = asyncio.create_task(self.flush_later())
+
+        if report := self.reports.get(fingerprint):
+            report.count += 1
+            return
+
+        report = ErrorReport(title, sections, first_seen=time.time())
+
+        # the first occurrence goes out right away, only repeats wait for the
+        # window, and a burst of distinct errors is capped like the repeats
+        if (
+            fingerprint in self.reported
+            or len(self.reported) >= settings.error_report_max_reports
+        ):
+            self.reports[fingerprint] = report
+            return
+
+        self.reported.add(fingerprint)
+
+        task = asyncio.create_task(self.send_all(fingerprint, report))
+        self.sending[task] = (fingerprint, report)
+        task.add_done_callback(self.sending.pop)
+
+    async def flush_later(self) -> None:
+        await asyncio.sleep(settings.error_report_window)
+        self.flush_task = None
+        await self.flush()
+
+    async def flush(self, digest: bool = False) -> None:
+        if self.flush_task and self.flush_task is not asyncio.current_task():
+            self.flush_task.cancel()
+            self.flush_task = None
+
+        reports, self.reports = self.reports, {}
+        # an error still repeating is batched in the next window too, one that
+        # stays quiet for a window is reported right away again
+        self.reported = set(reports)
+
+        # reports to one chat are paced, a burst of distinct errors is capped
+        # so the queue stays short and shutdown does not wait for it
+        if len(reports) > settings.error_report_max_reports:
+            fingerprints = sorted(reports, key=lambda key: reports[key].count)
+            dropped = fingerprints[: -settings.error_report_max_reports]
+
+            logger.warning(f"Dropped {len(dropped)} error reports: {dropped}")
+
+            for fingerprint in dropped:
+                del reports[fingerprint]
+
+        # on shutdown there is no time left for paced reports, first
+        # occurrences not sent yet go into the digest
+        if digest:
+            for task, (fingerprint, report) in list(self.sending.items()):
+                task.cancel()
+
+                if repeats := reports.get(fingerprint):
+                    report.count += repeats.count
+
+                reports[fingerprint] = report
+
+            await asyncio.gather(
+                *(
+                    self.send_digest(chat_id, reports)
+                    for chat_id in settings.bot_developer_chat_ids
+                )
+            )
+            return
+
+        # the next window forgets the errors that stopped repeating
+        if self.reported and not self.flush_task:
+            self.flush_task = asyncio.create_task(self.flush_later())
+
+        await asyncio.gather(
+            *(
+                self.send(chat_id, fingerprint, report, repeated=True)
+                for fingerprint, report in reports.items()
+                for chat_id in settings.bot_developer_chat_ids
+            )
+        )
+
+    async def send_all(self, fingerprint: str, report: ErrorReport) -> None:
+        await asyncio.gather(
+            *(
+                self.send(chat_id, fingerprint, report, repeated=False)
+                for chat_id in settings.bot_developer_chat_ids
+            )
+        )
+
+    async def pace(self, chat_id: int) -> None:
+        now = time.monotonic()
+        send_at = max(self.next_send_at.get(chat_id, 0), now)
+        self.next_send_at[chat_id] = send_at + settings.error_report_interval
+
+        await asyncio.sleep(send_at - now)
+
+    async def send_digest(self, chat_id: int, reports: dict[str, ErrorReport]) -> None:
+        if not reports:
+            return
+
+        lines = ["<b>Errors not reported before shutdown</b>"]
+        length = len(lines[0])
+
+        for fingerprint, report in reports.items():
+            line = (
+                f"{truncate_escaped(report.title, ERROR_DIGEST_TITLE_LENGTH)} "
+                f"x{report.count}, fingerprint <code>{fingerprint}</code>"
+            )
+
+            if length + len(line) + 1 > MessageLimit.MAX_TEXT_LENGTH:
+                break
+
+            lines.append(line)
+            length += len(line) + 1
+
+        try:
+            await telegram_application.bot.send_message(
+                chat_id=chat_id, text="\n".join(lines), parse_mode=ParseMode.HTML
+            )
+        except TelegramError as exc:
+            logger.error(f"Unable to send error digest to {chat_id}", exc_info=exc)
+
+    async def send(
+        self, chat_id: int, fingerprint: str, report: ErrorReport, repeated: bool
+    ) -> None:
+        window = f"{settings.error_report_window:.0f}s"
+
+        if repeated:
+            details = f"Occurred {report.count} time(s) in the last {window}"
+        else:
+            details = f"Repeats within {window} are reported together"
+
+        details += f", fingerprint <code>{fingerprint}</code>"
+        # the whole header must fit into a document caption, markup included
+        title = truncate_escaped(
+            report.title, MessageLimit.CAPTION_LENGTH - len(details) - len("<b></b>\n")
+        )
+        header = f"<b>{title}</b>\n{details}"
+        message = "\n\n".join(
+            [
+                header,
+                *(f"<pre>{html.escape(section)}</pre>" for section in report.sections),
+            ]
+        )
+
+        await self.pace(chat_id)
+
+        async with self.semaphore:
+            try:
+                if len(message) <= MessageLimit.MAX_TEXT_LENGTH:
+                    await telegram_application.bot.send_message(
+                        chat_id=chat_id, text=message, parse_mode=ParseMode.HTML
+                    )
+                    return
+
+                await telegram_application.bot.send_document(
+                    chat_id=chat_id,
+                    document=InputFile(
+                        "\n\n".join(report.sections).encode(),
+                        filename=f"error-{fingerprint}.txt",
+                    ),
+                    caption=header,
+                    parse_mode=ParseMode.HTML,
+                )
+
+            except TelegramError as exc:
+                logger.error(f"Unable to send error report to {chat_id}", exc_info=exc)
+
+
+error_aggregator = ErrorAggregator()
+
 
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
     logger.error("Exception while handling an update:", exc_info=context.error)
 
-    tb_list = traceback.format_exception(
-        None,
-        context.error,
-        context.error.__traceback__,  # pyright: ignore [reportOptionalMemberAccess]
-    )
+    error = context.error
+
+    if error is None:
+        return
+
+    tb_list = traceback.format_exception(None, error, error.__traceback__)
     tb_string = "".join(tb_list)
 
     update_str = json.dumps(
@@ -28,15 +255,13 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> N
         ensure_ascii=False,
     )
 
-    message = (
-        f"An exception was raised while handling an update\n"
-        f"<pre>update = {html.escape(update_str)}</pre>\n\n"
-        f"<pre>context.chat_data = {html.escape(str(context.chat_data))}</pre>\n\n"
-        f"<pre>context.user_data = {html.escape(str(context.user_data))}</pre>\n\n"
-        f"<pre>{html.escape(tb_string)}</pre>"
-    )
+    sections = [
+        f"update = {update_str}",
+        f"context.chat_data = {context.chat_data}",
+        f"context.user_data = {context.user_data}",
+        tb_string,
+    ]
 
-    for chat_id in settings.bot_developer_chat_ids:
-        await context.bot.send_message(
-            chat_id=chat_id, text=message, parse_mode=ParseMode.HTML
-        )
+    error_aggregator.add(
+        get_fingerprint(error), f"{type(error).__name__}: {error}", sections
+    )
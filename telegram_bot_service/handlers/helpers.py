@@ -13,6 +13,9 @@ from telegram.ext import ContextTypes
 
 from ..config import settings
 from ..language import get_user_translation_function
+from ..metrics import handler_duration
+from ..statistics import statistics
+from ..tracing import start_span
 from ..user import User, create_user
 
 logger = getLogger("service")
@@ -29,9 +32,13 @@ def log_update_data(
         logger.debug(f"{wrapped.__name__} update: {update}")
         logger.debug(f"{wrapped.__name__} user_data: {context.user_data}")
 
-        result = await wrapped(update=update, context=context, *args, **kwargs)
+        with handler_duration.time(wrapped.__name__), start_span(
+            f"handler {wrapped.__name__}"
+        ):
+            result = await wrapped(update=update, context=context, *args, **kwargs)
 
         logger.debug(f"{wrapped.__name__} output: {result}")
+        statistics.increment(f"handler:{wrapped.__name__}")
 
         return result
 
@@ -52,7 +59,8 @@ def authenticate_user(
             username=telegram_user.username,
         )
 
-        kwargs["user"] = await create_user(user)
+        with start_span(f"authenticate_user {wrapped.__name__}"):
+            kwargs["user"] = await create_user(user)
 
         return await wrapped(update=update, *args, **kwargs)
 
@@ -64,9 +72,10 @@ def require_admin(
 ) -> Callable[..., Coroutine[Any, Any, RT]]:
     @wraps(wrapped)
     async def wrapper(update: Update, *args: Any, **kwargs: Any) -> RT:
-        user_id = update.effective_user.id
-        if user_id not in settings.bot_admin_chat_ids:
-            raise PermissionError(f"User {user_id} is not admin")
+        with start_span(f"require_admin {wrapped.__name__}"):
+            user_id = update.effective_user.id
+            if user_id not in settings.bot_admin_chat_ids:
+                raise PermissionError(f"User {user_id} is not admin")
 
         return await wrapped(update=update, *args, **kwargs)
 
@@ -78,7 +87,8 @@ def send_typing_action(
 ) -> Callable[..., Coroutine[Any, Any, RT]]:
     @wraps(wrapped)
     async def wrapper(update: Update, *args: Any, **kwargs: Any) -> RT:
-        await update.effective_message.reply_chat_action(ChatAction.TYPING)
+        with start_span(f"send_typing_action {wrapped.__name__}"):
+            await update.effective_message.reply_chat_action(ChatAction.TYPING)
 
         return await wrapped(update=update, *args, **kwargs)
 
@@ -90,7 +100,10 @@ def get_translations(
 ) -> Callable[..., Coroutine[Any, Any, RT]]:
     @wraps(wrapped)
     async def wrapper(update: Update, *args: Any, **kwargs: Any) -> RT:
-        kwargs["translate"] = get_user_translation_function(update.effective_user.id)
+        with start_span(f"get_translations {wrapped.__name__}"):
+            kwargs["translate"] = get_user_translation_function(
+                update.effective_user.id
+            )
 
         return await wrapped(update=update, *args, **kwargs)
 
@@ -2,9 +2,14 @@
 
 # pyright: reportOptionalMemberAccess=false
 
+from functools import cache
+
 from telegram import KeyboardButton, ReplyKeyboardMarkup, Update
 from telegram.ext import ContextTypes
 
+from ..broadcast import unmark_blocked_user
+from ..health import register_warm_up
+from ..language import Language, get_translation
 from ..types import Translate
 from ..user import User
 from .constants import MenuState
@@ -16,6 +21,8 @@ from .helpers import (
 )
 
 
+# translation functions are cached per language, so is the keyboard built from them
+@cache
 def get_main_menu(translate: Translate) -> ReplyKeyboardMarkup:
     return get_auto_reply_keyboard(
         [
@@ -33,6 +40,12 @@ def get_main_menu(translate: Translate) -> ReplyKeyboardMarkup:
     )
 
 
+@register_warm_up("keyboards")
+async def warm_up_keyboards() -> None:
+    for language in Language:
+        get_main_menu(get_translation(language))
+
+
 @log_update_data
 @authenticate_user
 @get_translations
@@ -44,5 +57,8 @@ async def send_main_menu(
         translate("main_menu_description"), reply_markup=get_main_menu(translate)
     )
 
+    # a user who restarts the bot has unblocked it
+    unmark_blocked_user(user.telegram_id)
+
     context.user_data.clear()
     return MenuState.MAIN_MENU
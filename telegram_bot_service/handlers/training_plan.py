@@ -9,7 +9,17 @@ from telegram import KeyboardButton, ReplyKeyboardMarkup, Update
 from telegram.ext import ContextTypes
 
 from ..admin import notify_individual_plan
-from ..payment import Item, ItemType, Payment, create_payment
+from ..payment import (
+    Item,
+    ItemType,
+    Payment,
+    clear_unpaid_payment,
+    create_payment,
+    get_awaiting_payment,
+    schedule_unpaid_payment,
+)
+from ..payment import User as PaymentUser
+from ..statistics import statistics
 from ..training_plan import (
     Environment,
     FilterEnum,
@@ -18,6 +28,7 @@ from ..training_plan import (
     Level,
     Sex,
     get_property_values,
+    get_training_plan,
     get_training_plans,
 )
 from ..types import Translate
@@ -206,8 +217,8 @@ async def ask_health_condition(
         translate("health_condition_description"),
         reply_markup=get_auto_reply_keyboard(
             [
-                KeyboardButton(translate("health_condition_positive")),
-                KeyboardButton(translate("health_condition_negative")),
+                KeyboardButton(translate("health_condition_positive_button")),
+                KeyboardButton(translate("health_condition_negative_button")),
             ],
             additional_row=[KeyboardButton(translate("previous_question_button"))],
         ),
@@ -226,12 +237,12 @@ async def handle_health_condition(
     if choice == translate("previous_question_button"):
         return await ask_age_group(update=update, context=context, translate=translate)
 
-    if choice == translate("health_condition_positive"):
+    if choice == translate("health_condition_positive_button"):
         await update.effective_message.reply_text(
             translate("health_condition_on_positive")
         )
 
-    elif choice == translate("health_condition_negative"):
+    elif choice == translate("health_condition_negative_button"):
         await update.effective_message.reply_text(
             translate("health_condition_on_negative"),
             reply_markup=get_main_menu(translate),
@@ -426,20 +437,20 @@ async def send_payment_data(
 
     payment = await create_payment(
         Payment(
-            _id="",  # will be generated by the database
-            user={"telegram_id": update.effective_user.id},
-            items=[
+            id="",  # will be generated by the database
+            user=PaymentUser(telegram_id=update.effective_user.id),
+            items=(
                 Item(
                     price=training_plan.price,
                     item_type=ItemType.TRAINING_PLAN,
                     training_plan_id=training_plan.notion_id,
-                )
-            ],
+                ),
+            ),
         )
     )
 
-    context.user_data["payment"] = payment
-    context.user_data["training_plan"] = training_plan
+    schedule_unpaid_payment(payment, update.effective_user.id)
+    statistics.increment("payment:created")
 
     await update.effective_message.reply_text(
         translate("payment_training_plan_description").format(
@@ -466,15 +477,28 @@ async def save_payment_screenshot(
     if text == translate("previous_question_button"):
         return await ask_level(update=update, context=context, translate=translate)
 
+    if (payment := get_awaiting_payment(update.effective_user.id)) is None:
+        # a photo sent from the main menu while nothing is awaited, e.g. the
+        # source of a broadcast, is left alone
+        if update.message.photo:
+            return MenuState.MAIN_MENU
+
+        # only reached in this state, the payment expired in the meantime
+        return await send_main_menu(update=update, context=context)
+
     if not update.message.photo:
         await update.effective_message.reply_text(translate("payment_not_screenshot"))
         return MenuState.PAYMENT_SCREENSHOT
 
+    training_plan = await get_training_plan(payment.items[0].training_plan_id)
+
+    # admins can decide as soon as they are notified, even if the status
+    # change below fails, so the payment must no longer expire by then
+    clear_unpaid_payment(payment.id, update.effective_user.id)
     await notify_individual_plan(
-        update.effective_message,
-        payment=context.user_data["payment"],
-        training_plan=context.user_data["training_plan"],
+        update.effective_message, payment=payment, training_plan=training_plan
     )
+    statistics.increment("payment:submitted")
 
     await update.effective_message.reply_text(
         translate("payment_wait_confirmation"), reply_markup=get_main_menu(translate)
@@ -0,0 +1,166 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from logging import getLogger
+from typing import Any, Awaitable, Callable
+
+from redis import Redis
+from redis.exceptions import RedisError
+
+from .backend import BackendService, services
+from .config import settings
+from .storage import redis_clients
+
+logger = getLogger("service")
+
+WarmUp = Callable[[], Awaitable[None]]
+
+warm_ups: dict[str, WarmUp] = {}
+pending_warm_ups: set[str] = set()
+
+
+def register_warm_up(name: str) -> Callable[[WarmUp], WarmUp]:
+    def decorator(func: WarmUp) -> WarmUp:
+        warm_ups[name] = func
+        pending_warm_ups.add(name)
+
+        return func
+
+    return decorator
+
+
+async def run_warm_up(name: str, func: WarmUp) -> None:
+    started = time.perf_counter()
+
+    try:
+        await func()
+    except Exception as exc:
+        # a failed warm-up only costs a cold cache, it must not keep us unready
+        logger.error(f"Warm-up {name} failed", exc_info=exc)
+
+    pending_warm_ups.discard(name)
+    logger.info(f"Warm-up {name} took {time.perf_counter() - started:.3f}s")
+
+
+async def warm_up() -> None:
+    await asyncio.gather(*(run_warm_up(name, func) for name, func in warm_ups.items()))
+
+
+@dataclass
+class ProbeResult:
+    healthy: bool
+    latency: float
+    checked_at: float
+    error: str | None = None
+
+
+class Probe:
+    def __init__(self, name: str, check: Callable[[], Awaitable[Any]]) -> None:
+        self.name = name
+        self.check = check
+
+        self.result: ProbeResult | None = None
+        self.lock = asyncio.Lock()
+
+    def is_fresh(self) -> bool:
+        return (
+            self.result is not None
+            and time.monotonic() - self.result.checked_at < settings.health_probe_ttl
+        )
+
+    async def run(self) -> ProbeResult:
+        # concurrent readiness requests share a single probe
+        async with self.lock:
+            if self.is_fresh():
+                return self.result  # type: ignore [return-value]
+
+            started = time.perf_counter()
+            error = None
+
+            try:
+                await asyncio.wait_for(self.check(), settings.health_probe_timeout)
+            except Exception as exc:
+                error = repr(exc)
+
+            self.result = ProbeResult(
+                healthy=error is None,
+                latency=time.perf_counter() - started,
+                checked_at=time.monotonic(),
+                error=error,
+            )
+
+            return self.result
+
+
+def create_redis_probe(client: Redis) -> Probe:
+    db = client.connection_pool.connection_kwargs.get("db", 0)
+
+    async def check() -> None:
+        if not await asyncio.to_thread(client.ping):
+            raise RedisError("PING failed")
+
+    return Probe(f"redis-{db}", check)
+
+
+def create_backend_probe(service: BackendService) -> Probe:
+    async def check() -> None:
+        # bypasses the breaker and the metrics, only reachability is checked
+        response = await service.client.request("HEAD", "/")
+
+        if response.is_server_error:
+            raise RuntimeError(f"{service.name} returned {response.status_code}")
+
+    return Probe(service.name, check)
+
+
+probes: list[Probe] = []
+
+
+def get_probes() -> list[Probe]:
+    # clients and services register on import, so probes are built on first use
+    if not probes:
+        probes.extend(create_redis_probe(client) for client in redis_clients)
+        probes.extend(create_backend_probe(service) for service in services.values())
+
+    return probes
+
+
+def get_recent_latency(probe: Probe) -> float | None:
+    if not (service := services.get(probe.name)) or not service.latencies:
+        return None
+
+    ordered = sorted(service.latencies)
+    return ordered[len(ordered) // 2]
+
+
+async def get_readiness() -> tuple[bool, dict[str, Any]]:
+    results = await asyncio.gather(*(probe.run() for probe in get_probes()))
+
+    dependencies = {}
+
+    for probe, result in zip(get_probes(), results):
+        dependencies[probe.name] = {
+            "healthy": result.healthy,
+            "probe_latency_ms": round(result.latency * 1000, 3),
+            "recent_latency_ms": (
+                round(latency * 1000, 3)
+                if (latency := get_recent_latency(probe)) is not None
+                else None
+            ),
+            "checked_ago": round(time.monotonic() - result.checked_at, 3),
+            "error": result.error,
+        }
+
+    ready = not pending_warm_ups and all(result.healthy for result in results)
+
+    return ready, {
+        "ready": ready,
+        "warming_up": sorted(pending_warm_ups),
+        "dependencies": dependencies,
+    }
+
+
+@register_warm_up("connections")
+async def warm_up_connections() -> None:
+    # opens the Redis and backend connection pools before the first update
+    await asyncio.gather(*(probe.run() for probe in get_probes()))
@@ -0,0 +1,206 @@
+import asyncio
+import secrets
+import time
+from datetime import timedelta
+from enum import Enum
+from logging import getLogger
+from typing import Awaitable, Callable
+
+from telegram.error import TelegramError
+
+from .config import settings
+from .storage import Lease, service_redis
+from .telegram import telegram_application
+
+logger = getLogger("service")
+
+
+class JobStatus(Enum):
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    INTERRUPTED = "interrupted"
+
+
+STATUS_TEXT = {
+    JobStatus.RUNNING: "виконується",
+    JobStatus.SUCCEEDED: "успішно завершено",
+    JobStatus.FAILED: "помилка",
+    JobStatus.INTERRUPTED: "перервано перезапуском",
+}
+
+
+def get_job_key(job_id: str) -> str:
+    return f"job:{job_id}"
+
+
+def get_job_lock_key(name: str) -> str:
+    return f"job_lock:{name}"
+
+
+class JobRunner:
+    def __init__(self) -> None:
+        self.tasks: dict[str, asyncio.Task[None]] = {}
+
+    def start(
+        self,
+        name: str,
+        title: str,
+        func: Callable[[], Awaitable[bool]],
+        chat_id: int,
+        message_id: int,
+    ) -> tuple[str, bool]:
+        # returns the job id and whether a new job was started
+        job_id = secrets.token_hex(4)
+
+        # the lock holds the id of the running job, whichever process runs it
+        lock = Lease(
+            service_redis, get_job_lock_key(name), settings.job_lock_ttl, job_id
+        )
+
+        while not lock.acquire():
+            if running_job_id := service_redis.get(get_job_lock_key(name)):
+                return running_job_id, False
+
+        service_redis.hset(
+            get_job_key(job_id),
+            mapping={
+                "name": name,
+                "title": title,
+                "status": JobStatus.RUNNING.value,
+                "started_at": time.time(),
+                "chat_id": chat_id,
+                "message_id": message_id,
+            },
+        )
+        service_redis.expire(get_job_key(job_id), settings.job_ttl)
+
+        self.tasks[job_id] = asyncio.create_task(self.run(job_id, name, func, lock))
+
+        return job_id, True
+
+    async def run(
+        self, job_id: str, name: str, func: Callable[[], Awaitable[bool]], lock: Lease
+    ) -> None:
+        work: asyncio.Future[bool] | None = None
+
+        # the lock is renewed well before it expires, reports follow their own pace
+        interval = min(settings.job_lock_ttl / 3, settings.job_report_interval)
+
+        try:
+            # the first report is edited in before the work starts, so it can
+            # never land after the final one of a short job
+            await self.report(job_id)
+
+            work = asyncio.ensure_future(func())
+            reported = time.monotonic()
+
+            while True:
+                done, _ = await asyncio.wait({work}, timeout=interval)
+
+                if done:
+                    break
+
+                self.renew_lock(job_id, name, lock)
+
+                if time.monotonic() - reported >= settings.job_report_interval:
+                    reported = time.monotonic()
+                    await self.report(job_id)
+
+            status = JobStatus.SUCCEEDED if work.result() else JobStatus.FAILED
+            error = ""
+
+        except asyncio.CancelledError:
+            if work:
+                work.cancel()
+
+            raise
+
+        except Exception as exc:
+            logger.error(f"Job {name} {job_id} failed", exc_info=exc)
+            status, error = JobStatus.FAILED, repr(exc)
+
+        finally:
+            del self.tasks[job_id]
+            self.release_lock(job_id, name, lock)
+
+        service_redis.hset(
+            get_job_key(job_id),
+            mapping={
+                "status": status.value,
+                "finished_at": time.time(),
+                "error": error,
+            },
+        )
+
+        logger.info(f"Job {name} {job_id} {status.value}")
+        await self.report(job_id)
+
+    def renew_lock(self, job_id: str, name: str, lock: Lease) -> None:
+        try:
+            if not lock.renew():
+                logger.warning(f"Job {name} {job_id} lost its lock")
+        except Exception as exc:
+            logger.warning(f"Unable to renew job {name} {job_id} lock: {exc!r}")
+
+    def release_lock(self, job_id: str, name: str, lock: Lease) -> None:
+        try:
+            lock.release()
+        except Exception as exc:
+            logger.warning(f"Unable to release job {name} {job_id} lock: {exc!r}")
+
+    def get_status(self, job_id: str) -> str | None:
+        if not (job := service_redis.hgetall(get_job_key(job_id))):
+            return None
+
+        return self.format_status(job_id, job)
+
+    def format_status(self, job_id: str, job: dict[str, str]) -> str:
+        status = JobStatus(job["status"])
+
+        # the process that ran the job stopped before it finished
+        if (
+            status == JobStatus.RUNNING
+            and service_redis.get(get_job_lock_key(job["name"])) != job_id
+        ):
+            status = JobStatus.INTERRUPTED
+
+        elapsed = float(job.get("finished_at") or time.time()) - float(
+            job["started_at"]
+        )
+
+        lines = [
+            f"{job['title']} ({job_id})",
+            f"Статус: {STATUS_TEXT[status]}",
+            f"Тривалість: {timedelta(seconds=int(elapsed))}",
+        ]
+
+        if job.get("error"):
+            lines.append(f"Помилка: {job['error']}")
+
+        return "\n".join(lines)
+
+    async def report(self, job_id: str) -> None:
+        if not (job := service_redis.hgetall(get_job_key(job_id))):
+            return
+
+        try:
+            await telegram_application.bot.edit_message_text(
+                chat_id=job["chat_id"],
+                message_id=int(job["message_id"]),
+                text=self.format_status(job_id, job),
+                parse_mode=None,
+            )
+        except TelegramError as exc:
+            logger.warning(f"Unable to report job {job_id} progress: {exc!r}")
+
+    async def stop(self) -> None:
+        tasks = list(self.tasks.values())
+
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+job_runner = JobRunner()
@@ -0,0 +1,47 @@
+import asyncio
+from enum import Enum
+
+from telegram import Update
+
+from .config import settings
+from .handlers import get_conversation_state
+from .handlers.constants import MenuState
+
+
+class Lane(Enum):
+    ADMIN = "admin"
+    PAYMENT = "payment"
+    GENERAL = "general"
+
+
+lane_semaphores = {
+    Lane.ADMIN: asyncio.Semaphore(settings.lane_admin_concurrency),
+    Lane.PAYMENT: asyncio.Semaphore(settings.lane_payment_concurrency),
+    Lane.GENERAL: asyncio.Semaphore(settings.lane_general_concurrency),
+}
+
+
+def classify_update(update: Update) -> Lane:
+    user = update.effective_user
+    chat = update.effective_chat
+
+    if (user and user.id in settings.bot_admin_chat_ids) or (
+        chat
+        and (
+            chat.id in settings.bot_admin_chat_ids
+            or chat.id == settings.bot_admin_group_chat_id
+        )
+    ):
+        return Lane.ADMIN
+
+    if update.message and update.message.photo:
+        return Lane.PAYMENT
+
+    if (
+        user
+        and chat
+        and get_conversation_state(chat.id, user.id) == MenuState.PAYMENT_SCREENSHOT
+    ):
+        return Lane.PAYMENT
+
+    return Lane.GENERAL
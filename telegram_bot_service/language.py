@@ -1,17 +1,13 @@
 import gettext
 from enum import Enum
-
-from redis import Redis
+from functools import cache
 
 from .config import settings
+from .health import register_warm_up
+from .storage import create_redis
 from .types import Translate
 
-language_redis = Redis(
-    host=settings.redis_host,
-    port=settings.redis_port,
-    db=settings.redis_language_db,
-    decode_responses=True,
-)
+language_redis = create_redis(settings.redis_language_db)
 
 
 class Language(Enum):
@@ -19,12 +15,49 @@ class Language(Enum):
     ENGLISH = "en"
 
 
+@cache
+def get_translation(language: Language) -> Translate:
+    return gettext.translation(
+        "messages", "locale", languages=[language.value], fallback=True
+    ).gettext
+
+
+@cache
+def get_button_ids() -> dict[str, str]:
+    # every keyboard msgid ends in _button, the recorder and the funnel
+    # keep only the texts found here
+    button_ids = {}
+
+    for language in Language:
+        translation = gettext.translation(
+            "messages", "locale", languages=[language.value], fallback=True
+        )
+
+        for string_id, text in getattr(translation, "_catalog", {}).items():
+            if isinstance(string_id, str) and string_id.endswith("_button"):
+                button_ids[text] = string_id
+
+    return button_ids
+
+
+def get_button_id(text: str) -> str | None:
+    # without compiled catalogs the buttons show their string ids
+    if text.endswith("_button"):
+        return get_button_ids().get(text, text)
+
+    return get_button_ids().get(text)
+
+
+@register_warm_up("translations")
+async def warm_up_translations() -> None:
+    for language in Language:
+        get_translation(language)
+
+
 def get_user_translation_function(telegram_id: int) -> Translate:
     language = Language.UKRAINIAN
 
     if redis_value := language_redis.get(str(telegram_id)):
         language = Language(redis_value)
 
-    return gettext.translation(
-        "messages", "locale", languages=[language.value], fallback=True
-    ).gettext
+    return get_translation(language)
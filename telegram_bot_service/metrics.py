@@ -0,0 +1,254 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+LabelValues = tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labelnames: tuple[str, ...], values: LabelValues) -> str:
+    if not labelnames:
+        return ""
+
+    pairs = ",".join(
+        f'{name}="{escape_label_value(value)}"'
+        for name, value in zip(labelnames, values)
+    )
+    return f"{{{pairs}}}"
+
+
+class Metric(ABC):
+    metric_type = ""
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = ()
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        # redis calls record their latency from worker threads too
+        self.lock = threading.Lock()
+
+        registry.append(self)
+
+    def render(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+            *self.samples(),
+        ]
+
+    @abstractmethod
+    def samples(self) -> list[str]:
+        ...
+
+
+class Counter(Metric):
+    metric_type = "counter"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = ()
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.values: dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> list[str]:
+        with self.lock:
+            values = list(self.values.items())
+
+        return [
+            f"{self.name}{format_labels(self.labelnames, labels)} {value}"
+            for labels, value in values
+        ]
+
+
+class Gauge(Metric):
+    metric_type = "gauge"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = ()
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.values: dict[LabelValues, float] = {}
+        self.function: Callable[[], dict[LabelValues, float]] | None = None
+
+    def set(self, value: float, *labels: str) -> None:
+        with self.lock:
+            self.values[labels] = value
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.set(time.perf_counter() - started, *labels)
+
+    def set_function(self, function: Callable[[], dict[LabelValues, float]]) -> None:
+        self.function = function
+
+    def samples(self) -> list[str]:
+        if self.function:
+            values = self.function()
+        else:
+            with self.lock:
+                values = dict(self.values)
+
+        return [
+            f"{self.name}{format_labels(self.labelnames, labels)} {value}"
+            for labels, value in values.items()
+        ]
+
+
+class Histogram(Metric):
+    metric_type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+        # per label set: bucket counts (last one is +Inf), sum
+        self.counts: dict[LabelValues, list[int]] = {}
+        self.sums: dict[LabelValues, float] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self.lock:
+            if (counts := self.counts.get(labels)) is None:
+                counts = self.counts[labels] = [0] * (len(self.buckets) + 1)
+                self.sums[labels] = 0
+
+            counts[bisect_left(self.buckets, value)] += 1
+            self.sums[labels] += value
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def samples(self) -> list[str]:
+        with self.lock:
+            series = [
+                (labels, list(counts), self.sums[labels])
+                for labels, counts in self.counts.items()
+            ]
+
+        lines = []
+
+        for labels, counts, total in series:
+            cumulative = 0
+
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                bucket_labels = format_labels(
+                    (*self.labelnames, "le"), (*labels, str(bound))
+                )
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+
+            series_labels = format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{series_labels} {total}")
+            lines.append(f"{self.name}_count{series_labels} {cumulative}")
+
+        return lines
+
+
+registry: list[Metric] = []
+
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in registry for line in metric.render()) + "\n"
+
+
+updates_total = Counter(
+    "telegram_updates_total", "Telegram updates received by type", ("type",)
+)
+handler_duration = Histogram(
+    "handler_duration_seconds", "Update handler latency", ("handler",)
+)
+backend_request_duration = Histogram(
+    "backend_request_duration_seconds",
+    "Backend service request latency",
+    ("service", "method"),
+)
+backend_request_errors = Counter(
+    "backend_request_errors_total",
+    "Backend service requests that failed or returned 5xx",
+    ("service",),
+)
+backend_circuit_state = Gauge(
+    "backend_circuit_state",
+    "Backend circuit breaker state (0 closed, 1 half-open, 2 open)",
+    ("service",),
+)
+redis_command_duration = Histogram(
+    "redis_command_duration_seconds",
+    "Redis command latency, pipelines are observed as one PIPELINE command",
+    ("db", "command"),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+redis_pipelined_commands = Counter(
+    "redis_pipelined_commands_total",
+    "Redis commands sent in pipelines",
+    ("db", "command"),
+)
+bot_api_request_duration = Histogram(
+    "bot_api_request_duration_seconds", "Telegram Bot API request latency", ("method",)
+)
+bot_api_rate_limited = Counter(
+    "bot_api_rate_limited_total",
+    "Telegram Bot API requests rejected with 429",
+    ("method",),
+)
+lane_wait_duration = Histogram(
+    "lane_wait_duration_seconds",
+    "Time updates wait for a free slot in their priority lane",
+    ("lane",),
+)
+rate_limited_updates = Counter(
+    "rate_limited_updates_total", "Updates dropped by the rate limiter", ("type",)
+)
+rate_limited_users = Gauge(
+    "rate_limited_users", "Users that had updates rate limited in the offender window"
+)
+broadcast_messages = Counter(
+    "broadcast_messages_total", "Broadcast messages by delivery result", ("result",)
+)
+training_plan_cache_lookups = Counter(
+    "training_plan_cache_lookups_total",
+    "Training plan lookups by the cache layer that answered them",
+    ("source",),
+)
+notification_retries = Counter(
+    "notification_retries_total", "Deferred user notifications by outcome", ("result",)
+)
+unpaid_payments = Counter(
+    "unpaid_payments_total", "Unpaid payments reminded or expired", ("action",)
+)
+conversations = Gauge(
+    "conversations", "Active conversations per menu state", ("state",)
+)
+startup_phase_duration = Gauge(
+    "startup_phase_duration_seconds", "Duration of worker startup phases", ("phase",)
+)
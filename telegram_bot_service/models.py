@@ -0,0 +1,73 @@
+import dataclasses
+import json
+from functools import cache
+from typing import Any, Protocol, Self, TypeVar, get_args, get_origin, get_type_hints
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel, Field, create_model
+
+from .config import settings
+
+
+class Model(Protocol):
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> Self:
+        ...
+
+
+ModelT = TypeVar("ModelT", bound=Model)
+
+
+def get_schema_type(field_type: Any) -> Any:
+    if dataclasses.is_dataclass(field_type):
+        return get_schema(field_type)  # type: ignore [arg-type]
+
+    if (origin := get_origin(field_type)) in (list, tuple):
+        return origin[
+            tuple(
+                arg if arg is Ellipsis else get_schema_type(arg)
+                for arg in get_args(field_type)
+            )
+        ]
+
+    return field_type
+
+
+@cache
+def get_schema(model: type) -> type[BaseModel]:
+    # pydantic 1 cannot validate slotted dataclasses,
+    # an equivalent model is built from their fields instead
+    type_hints = get_type_hints(model)
+
+    return create_model(  # type: ignore [call-overload, no-any-return]
+        f"{model.__name__}Schema",
+        **{
+            field.name: (
+                get_schema_type(type_hints[field.name]),
+                Field(
+                    ... if field.default is dataclasses.MISSING else field.default,
+                    alias=field.metadata.get("alias", field.name),
+                ),
+            )
+            for field in dataclasses.fields(model)
+        },
+    )
+
+
+def decode(model: type[ModelT], data: dict[str, Any]) -> ModelT:
+    if settings.model_validation:
+        data = get_schema(model).parse_obj(data).dict(by_alias=True)
+
+    return model.from_dict(data)
+
+
+def decode_json(model: type[ModelT], raw: str | bytes) -> ModelT:
+    return decode(model, json.loads(raw))
+
+
+def decode_json_list(model: type[ModelT], raw: str | bytes) -> list[ModelT]:
+    return [decode(model, data) for data in json.loads(raw)]
+
+
+def encode_json(instance: Any) -> str:
+    return json.dumps(jsonable_encoder(instance))
@@ -0,0 +1,256 @@
+import asyncio
+import json
+import random
+import secrets
+import time
+from logging import getLogger
+from typing import Any, cast
+
+from redis.exceptions import WatchError
+from telegram import InlineKeyboardMarkup
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+from .config import settings
+from .metrics import notification_retries
+from .storage import service_redis
+from .telegram import telegram_application
+
+logger = getLogger("service")
+
+RETRY_QUEUE_KEY = "notifications:retry"
+DEAD_LETTERS_KEY = "notifications:dead"
+
+
+def get_retry_delay(attempts: int) -> float:
+    delay = min(
+        settings.notification_retry_max_delay,
+        settings.notification_retry_base_delay * 2**attempts,
+    )
+
+    # half of the delay is jitter, so users failed together are not retried together
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def is_permanent_error(error: TelegramError) -> bool:
+    # the user blocked the bot or the chat is gone, only a replay can help
+    return isinstance(error, (Forbidden, BadRequest))
+
+
+def schedule_notification(notification: dict[str, Any], delay: float) -> None:
+    service_redis.zadd(RETRY_QUEUE_KEY, {json.dumps(notification): time.time() + delay})
+
+
+def add_dead_letter(notification: dict[str, Any]) -> None:
+    with service_redis.pipeline() as pipeline:
+        pipeline.lpush(DEAD_LETTERS_KEY, json.dumps(notification))
+        pipeline.ltrim(DEAD_LETTERS_KEY, 0, settings.notification_dead_letter_size - 1)
+        pipeline.execute()
+
+
+def defer_notification(
+    chat_id: int,
+    text: str,
+    error: TelegramError,
+    reply_markup: InlineKeyboardMarkup | None = None,
+) -> bool:
+    # returns whether the notification is retried or went to the dead letters
+    notification = {
+        "id": secrets.token_hex(8),
+        "chat_id": chat_id,
+        "text": text,
+        "reply_markup": reply_markup.to_dict() if reply_markup else None,
+        "attempts": 0,
+        "error": repr(error),
+    }
+
+    if is_permanent_error(error):
+        add_dead_letter(notification)
+        notification_retries.inc("dead")
+        return False
+
+    schedule_notification(notification, get_retry_delay(0))
+    notification_retries.inc("scheduled")
+
+    return True
+
+
+def get_dead_letters(limit: int) -> tuple[int, list[dict[str, Any]]]:
+    with service_redis.pipeline() as pipeline:
+        pipeline.llen(DEAD_LETTERS_KEY)
+        pipeline.lrange(DEAD_LETTERS_KEY, 0, limit - 1)
+        total, raw_notifications = pipeline.execute()
+
+    return total, [json.loads(raw) for raw in raw_notifications]
+
+
+def replay_dead_letters(notification_ids: list[str] | None = None) -> int:
+    # ids stay with their notification, positions shift with every new dead letter
+    raw_notifications = service_redis.lrange(DEAD_LETTERS_KEY, 0, -1)
+
+    if notification_ids is not None:
+        raw_notifications = [
+            raw
+            for raw in raw_notifications
+            if json.loads(raw)["id"] in notification_ids
+        ]
+
+    with service_redis.pipeline() as pipeline:
+        for raw in raw_notifications:
+            notification = {**json.loads(raw), "attempts": 0}
+
+            pipeline.lrem(DEAD_LETTERS_KEY, 1, raw)
+            pipeline.zadd(RETRY_QUEUE_KEY, {json.dumps(notification): time.time()})
+
+        pipeline.execute()
+
+    return len(raw_notifications)
+
+
+class NotificationRetrier:
+    def __init__(self) -> None:
+        self.task: asyncio.Task[None] | None = None
+
+        self.stopping = False
+        self.sending = False
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self, timeout: float | None = 0) -> None:
+        if not self.task:
+            return
+
+        self.stopping = True
+
+        # an idle retrier stops at once, a batch being sent is given the timeout
+        if not self.sending:
+            self.task.cancel()
+            timeout = None
+
+        try:
+            await asyncio.wait_for(self.task, timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Notification retries did not finish, they stay leased")
+        except asyncio.CancelledError:
+            pass
+
+    async def run(self) -> None:
+        while not self.stopping:
+            try:
+                await self.retry_due()
+            except Exception as exc:
+                logger.error("Unable to retry notifications", exc_info=exc)
+
+            # a batch finished during shutdown ends the task right away
+            if self.stopping:
+                return
+
+            await asyncio.sleep(settings.notification_retry_poll_interval)
+
+    def claim_due(self) -> list[str]:
+        now = time.time()
+
+        # claimed entries are hidden for the lease instead of removed, a worker
+        # stopped before finishing leaves them to be retried again
+        with service_redis.pipeline() as pipeline:
+            try:
+                pipeline.watch(RETRY_QUEUE_KEY)
+                raw_notifications = cast(
+                    list[str],
+                    pipeline.zrangebyscore(
+                        RETRY_QUEUE_KEY,
+                        0,
+                        now,
+                        start=0,
+                        num=settings.notification_retry_batch_size,
+                    ),
+                )
+
+                if not raw_notifications:
+                    return []
+
+                leased_until = now + settings.notification_retry_lease
+
+                pipeline.multi()
+                pipeline.zadd(
+                    RETRY_QUEUE_KEY, {raw: leased_until for raw in raw_notifications}
+                )
+                pipeline.execute()
+
+            except WatchError:
+                # another worker claimed them or a notification was deferred meanwhile
+                return []
+
+        return raw_notifications
+
+    async def retry_due(self) -> None:
+        raw_notifications = self.claim_due()
+        self.sending = True
+
+        try:
+            for index, raw in enumerate(raw_notifications):
+                if self.stopping:
+                    self.release(raw_notifications[index:])
+                    return
+
+                await self.retry(raw)
+                await asyncio.sleep(1 / settings.notification_retry_rate)
+        finally:
+            self.sending = False
+
+    def release(self, raw_notifications: list[str]) -> None:
+        # claimed but unsent entries are due again for the next worker
+        service_redis.zadd(
+            RETRY_QUEUE_KEY, {raw: time.time() for raw in raw_notifications}, xx=True
+        )
+
+    async def retry(self, raw: str) -> None:
+        notification = json.loads(raw)
+
+        try:
+            await telegram_application.bot.send_message(
+                chat_id=notification["chat_id"],
+                text=notification["text"],
+                reply_markup=InlineKeyboardMarkup.de_json(  # type: ignore [arg-type]
+                    notification["reply_markup"], telegram_application.bot
+                ),
+            )
+
+        except RetryAfter as exc:
+            # a flood limit is not the notification's fault, no attempt is counted
+            schedule_notification(notification, exc.retry_after)
+            return
+
+        except TelegramError as exc:
+            notification = {
+                **notification,
+                "attempts": notification["attempts"] + 1,
+                "error": repr(exc),
+            }
+
+            # the next attempt is stored before the claimed entry is dropped,
+            # a crash in between repeats a notification rather than losing it
+            if (
+                is_permanent_error(exc)
+                or notification["attempts"] >= settings.notification_retry_max_attempts
+            ):
+                logger.warning(f"Notification to {notification['chat_id']} failed")
+                add_dead_letter(notification)
+                notification_retries.inc("dead")
+            else:
+                schedule_notification(
+                    notification, get_retry_delay(notification["attempts"])
+                )
+                notification_retries.inc("scheduled")
+
+            service_redis.zrem(RETRY_QUEUE_KEY, raw)
+            return
+
+        # only a delivered entry leaves the queue, until then the lease brings it back
+        service_redis.zrem(RETRY_QUEUE_KEY, raw)
+
+        logger.info(f"Delivered deferred notification to {notification['chat_id']}")
+        notification_retries.inc("sent")
+
+
+notification_retrier = NotificationRetrier()
@@ -1,25 +1,52 @@
+import time
+from dataclasses import dataclass, field
 from enum import Enum
+from typing import Any
 
-import httpx
 from fastapi.encoders import jsonable_encoder
-from pydantic import BaseModel, Field
+from redis.exceptions import WatchError
 
+from .backend import BackendService
 from .config import settings
+from .models import decode_json
+from .storage import service_redis
 
+UNPAID_REMINDERS_KEY = "payments:reminders"
+UNPAID_EXPIRIES_KEY = "payments:expiries"
+AWAITING_PAYMENT_KEY = "payments:awaiting:{}"
 
-class User(BaseModel):
+payment_service = BackendService(
+    "payment-service", settings.payment_service_url, settings.payment_service_timeout
+)
+
+
+@dataclass(frozen=True, slots=True)
+class User:
     telegram_id: int
 
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "User":
+        return cls(telegram_id=int(data["telegram_id"]))
+
 
 class ItemType(Enum):
     TRAINING_PLAN = 1
 
 
-class Item(BaseModel):
+@dataclass(frozen=True, slots=True)
+class Item:
     price: float
 
     item_type: ItemType
-    training_plan_id: str | None
+    training_plan_id: str | None = None
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "Item":
+        return cls(
+            price=float(data["price"]),
+            item_type=ItemType(data["item_type"]),
+            training_plan_id=data.get("training_plan_id"),
+        )
 
 
 class PaymentStatus(Enum):
@@ -30,33 +57,112 @@ class PaymentStatus(Enum):
     CREATED = 4
 
 
-class Payment(BaseModel):
-    id: str = Field(alias="_id")
+@dataclass(frozen=True, slots=True)
+class Payment:
+    id: str = field(metadata={"alias": "_id"})
 
     user: User
-    items: list[Item]
-
-    class Config:
-        allow_population_by_field_name = True
+    items: tuple[Item, ...]
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "Payment":
+        return cls(
+            id=data["_id"],
+            user=User.from_dict(data["user"]),
+            items=tuple(Item.from_dict(item) for item in data["items"]),
+        )
 
 
 async def create_payment(payment: Payment) -> Payment:
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            url=settings.payment_service_url + "/",
-            timeout=settings.payment_service_timeout,
-            json=jsonable_encoder(payment, exclude={"id"}),
+    response = await payment_service.request(
+        "POST", "/", json=jsonable_encoder(payment, exclude={"id"})
+    )
+
+    return decode_json(Payment, response.content)
+
+
+def get_unpaid_payment_member(payment_id: str, telegram_id: int) -> str:
+    return f"{telegram_id}:{payment_id}"
+
+
+def schedule_unpaid_payment(payment: Payment, telegram_id: int) -> None:
+    member = get_unpaid_payment_member(payment.id, telegram_id)
+    item = payment.items[0]
+    now = time.time()
+
+    with service_redis.pipeline() as pipeline:
+        pipeline.zadd(
+            UNPAID_REMINDERS_KEY, {member: now + settings.payment_reminder_delay}
+        )
+        pipeline.zadd(
+            UNPAID_EXPIRIES_KEY, {member: now + settings.payment_expiry_delay}
+        )
+        # the screenshot is awaited in redis rather than in the conversation,
+        # which lives in one process's memory and is gone after a restart
+        pipeline.delete(AWAITING_PAYMENT_KEY.format(telegram_id))
+        pipeline.hset(
+            AWAITING_PAYMENT_KEY.format(telegram_id),
+            mapping={
+                "payment_id": payment.id,
+                "price": item.price,
+                "training_plan_id": item.training_plan_id or "",
+            },
         )
+        pipeline.execute()
 
-    return Payment(**response.json())
+
+def get_awaiting_payment(telegram_id: int) -> Payment | None:
+    if not (data := service_redis.hgetall(AWAITING_PAYMENT_KEY.format(telegram_id))):
+        return None
+
+    return Payment(
+        id=data["payment_id"],
+        user=User(telegram_id=telegram_id),
+        items=(
+            Item(
+                price=float(data["price"]),
+                item_type=ItemType.TRAINING_PLAN,
+                training_plan_id=data["training_plan_id"],
+            ),
+        ),
+    )
+
+
+def clear_awaiting_payment(payment_id: str, telegram_id: int) -> bool:
+    # returns whether the payment was awaited, a newer one is left in place
+    key = AWAITING_PAYMENT_KEY.format(telegram_id)
+
+    with service_redis.pipeline() as pipeline:
+        try:
+            pipeline.watch(key)
+
+            if pipeline.hget(key, "payment_id") != payment_id:
+                return False
+
+            pipeline.multi()
+            pipeline.delete(key)
+            pipeline.execute()
+
+        except WatchError:
+            return False
+
+    return True
+
+
+def clear_unpaid_payment(payment_id: str, telegram_id: int) -> None:
+    member = get_unpaid_payment_member(payment_id, telegram_id)
+
+    with service_redis.pipeline() as pipeline:
+        pipeline.zrem(UNPAID_REMINDERS_KEY, member)
+        pipeline.zrem(UNPAID_EXPIRIES_KEY, member)
+        pipeline.execute()
+
+    clear_awaiting_payment(payment_id, telegram_id)
 
 
 async def update_payment(payment_id: str, new_status: PaymentStatus) -> Payment:
-    async with httpx.AsyncClient() as client:
-        response = await client.put(
-            url=settings.payment_service_url + f"/{payment_id}/",
-            timeout=settings.payment_service_timeout,
-            json={"status": new_status.value},
-        )
+    response = await payment_service.request(
+        "PUT", f"/{payment_id}/", json={"status": new_status.value}
+    )
 
-    return Payment(**response.json())
+    return decode_json(Payment, response.content)
@@ -0,0 +1,188 @@
+import asyncio
+import time
+from logging import getLogger
+from typing import Awaitable, Callable, cast
+
+from redis.exceptions import WatchError
+from telegram.error import TelegramError
+
+from .admin import is_payment_submitted
+from .config import settings
+from .handlers.main_menu import get_main_menu
+from .language import get_user_translation_function
+from .metrics import unpaid_payments
+from .payment import (
+    UNPAID_EXPIRIES_KEY,
+    UNPAID_REMINDERS_KEY,
+    PaymentStatus,
+    clear_awaiting_payment,
+    get_awaiting_payment,
+    get_unpaid_payment_member,
+    update_payment,
+)
+from .statistics import statistics
+from .storage import service_redis
+from .telegram import telegram_application
+
+logger = getLogger("service")
+
+PaymentAction = Callable[[str, int], Awaitable[None]]
+
+
+class PaymentExpirer:
+    def __init__(self) -> None:
+        self.task: asyncio.Task[None] | None = None
+        self.semaphore = asyncio.Semaphore(settings.payment_expiry_concurrency)
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if not self.task:
+            return
+
+        self.task.cancel()
+
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.process_due(UNPAID_REMINDERS_KEY, self.remind)
+                await self.process_due(UNPAID_EXPIRIES_KEY, self.expire)
+            except Exception as exc:
+                logger.error("Unable to process unpaid payments", exc_info=exc)
+
+            await asyncio.sleep(settings.payment_expiry_poll_interval)
+
+    def claim_due(self, key: str) -> list[tuple[str, float]]:
+        now = time.time()
+        leased_until = now + settings.payment_expiry_lease
+
+        # claimed members are hidden for the lease instead of removed, a worker
+        # stopped before finishing leaves them to be processed again
+        with service_redis.pipeline() as pipeline:
+            try:
+                pipeline.watch(key)
+                members = cast(
+                    list[str],
+                    pipeline.zrangebyscore(
+                        key, 0, now, start=0, num=settings.payment_expiry_batch_size
+                    ),
+                )
+
+                if not members:
+                    return []
+
+                pipeline.multi()
+                pipeline.zadd(key, {member: leased_until for member in members})
+                pipeline.execute()
+
+            except WatchError:
+                # another worker claimed them or a payment was scheduled meanwhile
+                return []
+
+        return [(member, leased_until) for member in members]
+
+    def complete(self, key: str, member: str, leased_until: float) -> None:
+        # a member rescheduled during the action keeps its new score
+        with service_redis.pipeline() as pipeline:
+            try:
+                pipeline.watch(key)
+
+                if pipeline.zscore(key, member) != leased_until:
+                    return
+
+                pipeline.multi()
+                pipeline.zrem(key, member)
+                pipeline.execute()
+
+            except WatchError:
+                pass
+
+    async def process_due(self, key: str, action: PaymentAction) -> None:
+        while due := self.claim_due(key):
+            await asyncio.gather(
+                *(
+                    self.process(key, action, member, leased_until)
+                    for member, leased_until in due
+                )
+            )
+
+            if len(due) < settings.payment_expiry_batch_size:
+                return
+
+    async def process(
+        self, key: str, action: PaymentAction, member: str, leased_until: float
+    ) -> None:
+        telegram_id, payment_id = member.split(":", 1)
+
+        async with self.semaphore:
+            try:
+                await action(payment_id, int(telegram_id))
+            except Exception as exc:
+                logger.error(f"Unable to process unpaid {member}", exc_info=exc)
+                return
+
+            self.complete(key, member, leased_until)
+
+    async def remind(self, payment_id: str, telegram_id: int) -> None:
+        # the user may have started over with a newer payment since
+        payment = get_awaiting_payment(telegram_id)
+
+        if payment is None or payment.id != payment_id:
+            return
+
+        translate = get_user_translation_function(telegram_id)
+
+        try:
+            await telegram_application.bot.send_message(
+                chat_id=telegram_id, text=translate("payment_reminder")
+            )
+            unpaid_payments.inc("reminded")
+
+        except TelegramError as exc:
+            logger.warning(f"Unable to remind {telegram_id} of {payment_id}: {exc!r}")
+
+    async def expire(self, payment_id: str, telegram_id: int) -> None:
+        if is_payment_submitted(payment_id):
+            return
+
+        # the payment service has no expired status, an expired payment is rejected
+        try:
+            await update_payment(payment_id, PaymentStatus.REJECTED)
+
+        except Exception as exc:
+            logger.error(f"Unable to expire payment {payment_id}", exc_info=exc)
+            retry_at = time.time() + settings.payment_expiry_retry_delay
+            service_redis.zadd(
+                UNPAID_EXPIRIES_KEY,
+                {get_unpaid_payment_member(payment_id, telegram_id): retry_at},
+            )
+            return
+
+        unpaid_payments.inc("expired")
+        statistics.increment("payment:expired")
+
+        # the conversation ends on the user's next message, which finds
+        # nothing awaited and returns to the main menu
+        if not clear_awaiting_payment(payment_id, telegram_id):
+            return
+
+        translate = get_user_translation_function(telegram_id)
+
+        try:
+            await telegram_application.bot.send_message(
+                chat_id=telegram_id,
+                text=translate("payment_expired"),
+                reply_markup=get_main_menu(translate),
+            )
+
+        except TelegramError as exc:
+            logger.warning(f"Unable to notify {telegram_id} of expiry: {exc!r}")
+
+
+payment_expirer = PaymentExpirer()
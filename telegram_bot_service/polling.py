@@ -0,0 +1,135 @@
+import asyncio
+from logging import getLogger
+
+from telegram import Update
+
+from .config import settings
+from .storage import service_redis
+from .telegram import telegram_application
+from .updates import process_update
+
+logger = getLogger("service")
+
+OFFSET_KEY = "polling:offset"
+
+
+class UpdatePoller:
+    def __init__(self) -> None:
+        self.task: asyncio.Task[None] | None = None
+        self.semaphore = asyncio.Semaphore(settings.polling_concurrency)
+
+        self.offset: int | None = None
+
+        self.stopping = False
+        self.fetching = False
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+        self.task.add_done_callback(self.restart)
+
+    def restart(self, task: asyncio.Task[None]) -> None:
+        if task.cancelled() or self.stopping:
+            return
+
+        # the loop handles its own errors, nothing escaping it may stop polling
+        logger.error(
+            "Poller stopped unexpectedly, restarting", exc_info=task.exception()
+        )
+        self.start()
+
+    async def stop(self, timeout: float = 0) -> None:
+        if not self.task:
+            return
+
+        self.stopping = True
+
+        # a pending getUpdates call holds no updates yet and can be dropped,
+        # a batch being processed is given the timeout to finish
+        if self.fetching:
+            self.task.cancel()
+
+        try:
+            await asyncio.wait_for(self.task, timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Polled batch did not finish, it will be fetched again")
+        except asyncio.CancelledError:
+            pass
+
+    def get_retry_delay(self, attempt: int) -> float:
+        return min(
+            settings.polling_retry_delay * 2**attempt,
+            settings.polling_max_retry_delay,
+        )
+
+    async def prepare(self) -> None:
+        attempt = 0
+
+        while True:
+            try:
+                # getUpdates is refused by Telegram while a webhook is set
+                await telegram_application.bot.delete_webhook()
+
+                # after a restart the offset of this process is newer than the saved one
+                if self.offset is None:
+                    self.offset = int(service_redis.get(OFFSET_KEY) or 0)
+
+                return
+
+            except Exception as exc:
+                logger.error("Unable to prepare polling", exc_info=exc)
+                await asyncio.sleep(self.get_retry_delay(attempt))
+                attempt += 1
+
+    async def run(self) -> None:
+        await self.prepare()
+        logger.info(f"Polling for updates from offset {self.offset}")
+
+        attempt = 0
+
+        while not self.stopping:
+            try:
+                await self.poll()
+                attempt = 0
+
+            except Exception as exc:
+                logger.error("Unable to poll updates", exc_info=exc)
+                await asyncio.sleep(self.get_retry_delay(attempt))
+                attempt += 1
+
+    async def poll(self) -> None:
+        self.fetching = True
+
+        try:
+            updates = await telegram_application.bot.get_updates(
+                offset=self.offset or 0,
+                limit=settings.polling_limit,
+                timeout=settings.polling_timeout,
+                allowed_updates=Update.ALL_TYPES,
+            )
+        finally:
+            self.fetching = False
+
+        if not updates:
+            return
+
+        results = await asyncio.gather(
+            *(self.process(update) for update in updates), return_exceptions=True
+        )
+
+        for update, result in zip(updates, results):
+            if isinstance(result, Exception):
+                logger.error(
+                    f"Unable to process update {update.update_id}", exc_info=result
+                )
+
+        # the whole batch is done, so a restarted poller continues after it,
+        # a failed save only repeats the batch after a restart of the process
+        self.offset = updates[-1].update_id + 1
+        service_redis.set(OFFSET_KEY, self.offset)
+
+    async def process(self, update: Update) -> None:
+        async with self.semaphore:
+            await process_update(update)
+
+
+poller = UpdatePoller()
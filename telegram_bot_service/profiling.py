@@ -0,0 +1,226 @@
+import asyncio
+import cProfile
+import io
+import pstats
+import random
+import time
+from collections import Counter
+from contextlib import contextmanager
+from logging import getLogger
+from pathlib import Path
+from types import CoroutineType
+from typing import Any, Callable, Iterator
+
+from .config import settings
+
+logger = getLogger("service")
+
+profiles_directory = Path(settings.profiling_directory)
+
+# cProfile hooks the whole thread, so only one update is profiled at a time
+profiling_active = False
+# a profile also holds every other update the loop ran meanwhile,
+# it is only kept when the update ran alone
+running_updates = 0
+started_updates = 0
+
+save_tasks: set[asyncio.Task[None]] = set()
+
+
+def get_await_stack(task: asyncio.Task[Any]) -> str:
+    # Task.get_stack stops at the outermost suspended coroutine,
+    # the chain of awaits leads to where the update waits
+    frames = []
+    awaited: Any = task.get_coro()
+
+    while isinstance(awaited, CoroutineType) and awaited.cr_frame is not None:
+        code = awaited.cr_frame.f_code
+        frames.append(
+            f"{code.co_name} ({Path(code.co_filename).name}:"
+            f"{awaited.cr_frame.f_lineno})"
+        )
+        awaited = awaited.cr_await
+
+    return ";".join(frames)
+
+
+class StackSampler:
+    def __init__(self) -> None:
+        self.samples: dict[asyncio.Task[Any], Counter[str]] = {}
+        self.task: asyncio.Task[None] | None = None
+
+    def add(self, task: asyncio.Task[Any]) -> Counter[str]:
+        samples = self.samples[task] = Counter()
+
+        if not self.task:
+            self.task = asyncio.create_task(self.run())
+
+        return samples
+
+    def remove(self, task: asyncio.Task[Any]) -> None:
+        self.samples.pop(task, None)
+
+    async def run(self) -> None:
+        # one timer samples every update in flight, concurrent updates are told
+        # apart by their tasks instead of sharing one profiler
+        while self.samples:
+            await asyncio.sleep(settings.profiling_stack_interval)
+
+            for task, samples in list(self.samples.items()):
+                samples[get_await_stack(task)] += 1
+
+        self.task = None
+
+
+stack_sampler = StackSampler()
+
+
+def should_run_profiler() -> bool:
+    if not settings.profiling_enabled or profiling_active or running_updates > 1:
+        return False
+
+    return random.random() < settings.profiling_sample_rate
+
+
+@contextmanager
+def profile_update(update_id: int, update_type: str) -> Iterator[None]:
+    global running_updates, started_updates
+
+    running_updates += 1
+    started_updates += 1
+
+    try:
+        if should_run_profiler():
+            with run_profiler(update_id, update_type):
+                yield
+
+        elif settings.profiling_enabled and settings.profiling_threshold is not None:
+            with sample_stacks(update_id, update_type):
+                yield
+
+        else:
+            yield
+
+    finally:
+        running_updates -= 1
+
+
+ProfileWriter = Callable[[Path], None]
+
+
+def save_later(
+    name: str, write: ProfileWriter, update_id: int, duration: float
+) -> None:
+    # dumping and rotating files would block the loop, a thread does it
+    task = asyncio.create_task(
+        asyncio.to_thread(save, name, write, update_id, duration)
+    )
+    save_tasks.add(task)
+    task.add_done_callback(save_tasks.discard)
+
+
+@contextmanager
+def run_profiler(update_id: int, update_type: str) -> Iterator[None]:
+    global profiling_active
+
+    profiler = cProfile.Profile()
+    profiling_active = True
+    first_started = started_updates
+    started = time.perf_counter()
+    profiler.enable()
+
+    try:
+        yield
+
+    finally:
+        profiler.disable()
+        profiling_active = False
+        duration = time.perf_counter() - started
+
+        if started_updates != first_started:
+            logger.debug(f"Dropped profile of update {update_id}, others ran with it")
+        else:
+            save_later(
+                f"{update_id}-{update_type}-{duration * 1000:.0f}ms.prof",
+                profiler.dump_stats,
+                update_id,
+                duration,
+            )
+
+
+@contextmanager
+def sample_stacks(update_id: int, update_type: str) -> Iterator[None]:
+    # every update is timed, the stacks sampled meanwhile are kept for slow ones
+    task = asyncio.current_task()
+    samples = stack_sampler.add(task) if task else Counter()
+    started = time.perf_counter()
+
+    try:
+        yield
+
+    finally:
+        if task:
+            stack_sampler.remove(task)
+
+        duration = time.perf_counter() - started
+
+        if samples and duration >= settings.profiling_threshold:  # type: ignore
+            save_later(
+                f"{update_id}-{update_type}-{duration * 1000:.0f}ms.stacks",
+                lambda path: write_stacks(path, samples),
+                update_id,
+                duration,
+            )
+
+
+def write_stacks(path: Path, samples: Counter[str]) -> None:
+    # folded stacks, the input of flame graph tools
+    path.write_text(
+        "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
+    )
+
+
+def save(name: str, write: ProfileWriter, update_id: int, duration: float) -> None:
+    profiles_directory.mkdir(parents=True, exist_ok=True)
+    path = profiles_directory / f"{int(time.time())}-{name}"
+
+    try:
+        write(path)
+
+        for old_path in list_profiles()[settings.profiling_max_files :]:
+            old_path.unlink(missing_ok=True)
+
+    except OSError as exc:
+        logger.error(f"Unable to save profile of update {update_id}", exc_info=exc)
+        return
+
+    logger.info(f"Saved profile of update {update_id} ({duration:.3f}s) to {path}")
+
+
+def list_profiles() -> list[Path]:
+    if not profiles_directory.is_dir():
+        return []
+
+    return sorted(
+        (
+            path
+            for path in profiles_directory.iterdir()
+            if path.suffix in (".prof", ".stacks")
+        ),
+        key=lambda path: path.stat().st_mtime,
+        reverse=True,
+    )
+
+
+def get_profile(name: str) -> Path | None:
+    return next((path for path in list_profiles() if path.name == name), None)
+
+
+def format_profile(path: Path, limit: int = 50) -> str:
+    if path.suffix == ".stacks":
+        return "\n".join(path.read_text().splitlines()[:limit])
+
+    stream = io.StringIO()
+    pstats.Stats(str(path), stream=stream).sort_stats("cumulative").print_stats(limit)
+
+    return stream.getvalue()
@@ -0,0 +1,129 @@
+import time
+from collections import OrderedDict
+from logging import getLogger
+
+from telegram import Update
+from telegram.error import TelegramError
+
+from .config import settings
+from .language import Language, get_translation
+from .metrics import rate_limited_updates, rate_limited_users
+
+logger = getLogger("service")
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated", "limited")
+
+    def __init__(self, capacity: float) -> None:
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.limited = False
+
+    def consume(self, rate: float, capacity: float) -> bool:
+        now = time.monotonic()
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+        if self.tokens < 1:
+            return False
+
+        self.tokens -= 1
+        return True
+
+
+class RateLimiter:
+    def __init__(self) -> None:
+        self.buckets: OrderedDict[tuple[str, int], TokenBucket] = OrderedDict()
+        # last time each user was limited, oldest first
+        self.offenders: OrderedDict[int, float] = OrderedDict()
+
+    def get_limits(self, update_kind: str) -> tuple[float, float]:
+        if update_kind == "callback_query":
+            return settings.rate_limit_callback_rate, settings.rate_limit_callback_burst
+
+        return settings.rate_limit_message_rate, settings.rate_limit_message_burst
+
+    # returns whether the update is allowed and whether it's the first one
+    # limited since the user was last let through
+    def allow(self, update_kind: str, telegram_id: int) -> tuple[bool, bool]:
+        rate, capacity = self.get_limits(update_kind)
+        key = (update_kind, telegram_id)
+
+        if (bucket := self.buckets.get(key)) is None:
+            bucket = self.buckets[key] = TokenBucket(capacity)
+
+            if len(self.buckets) > settings.rate_limit_max_users:
+                self.buckets.popitem(last=False)
+
+        else:
+            self.buckets.move_to_end(key)
+
+        if bucket.consume(rate, capacity):
+            bucket.limited = False
+            return True, False
+
+        first = not bucket.limited
+        bucket.limited = True
+
+        self.offenders[telegram_id] = time.monotonic()
+        self.offenders.move_to_end(telegram_id)
+        self.prune_offenders()
+
+        return False, first
+
+    def prune_offenders(self) -> None:
+        expired_at = time.monotonic() - settings.rate_limit_offender_window
+
+        while self.offenders and next(iter(self.offenders.values())) < expired_at:
+            self.offenders.popitem(last=False)
+
+    def count_offenders(self) -> int:
+        self.prune_offenders()
+        return len(self.offenders)
+
+
+rate_limiter = RateLimiter()
+
+rate_limited_users.set_function(lambda: {(): rate_limiter.count_offenders()})
+
+
+async def is_rate_limited(update: Update) -> bool:
+    user = update.effective_user
+
+    if (
+        not settings.rate_limit_enabled
+        or user is None
+        or user.id in settings.bot_admin_chat_ids
+    ):
+        return False
+
+    update_kind = "callback_query" if update.callback_query else "message"
+    allowed, first = rate_limiter.allow(update_kind, user.id)
+
+    if allowed:
+        return False
+
+    rate_limited_updates.inc(update_kind)
+
+    if not first:
+        return True
+
+    logger.warning(f"Rate limiting {update_kind} updates from {user.id}")
+
+    if not settings.rate_limit_reply:
+        return True
+
+    # the reply skips user-service and the language lookup in Redis
+    text = get_translation(Language.UKRAINIAN)("rate_limited_text")
+
+    try:
+        if update.callback_query:
+            await update.callback_query.answer(text)
+        elif update.effective_message:
+            await update.effective_message.reply_text(text)
+
+    except TelegramError as exc:
+        logger.error(f"Unable to notify {user.id} about rate limit", exc_info=exc)
+
+    return True
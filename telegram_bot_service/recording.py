@@ -0,0 +1,222 @@
+import asyncio
+import gzip
+import hmac
+import json
+import time
+from datetime import datetime
+from logging import getLogger
+from pathlib import Path
+from typing import Any
+
+from .config import settings
+from .language import get_button_id
+
+logger = getLogger("service")
+
+# only what the replay needs to route updates the same way is recorded,
+# any field not listed here is dropped together with everything inside it
+CONTAINER_FIELDS = {
+    "message",
+    "edited_message",
+    "channel_post",
+    "edited_channel_post",
+    "callback_query",
+    "my_chat_member",
+    "chat_member",
+    "new_chat_member",
+    "old_chat_member",
+    "reply_to_message",
+    "chat",
+    "from",
+    "sender_chat",
+    "photo",
+    "entities",
+    "caption_entities",
+}
+STRUCTURAL_FIELDS = {
+    "date",
+    "edit_date",
+    "type",
+    "is_bot",
+    "status",
+    "is_topic_message",
+    "chat_instance",
+    "offset",
+    "length",
+    "width",
+    "height",
+    "file_size",
+}
+# required by the Bot API types, the value is replaced with the field name
+PLACEHOLDER_FIELDS = {"first_name"}
+FREE_TEXT_FIELDS = {"text", "caption"}
+# sequence numbers, they identify nobody and keep the replay in order
+SEQUENCE_IDS = {"update_id", "message_id", "message_thread_id"}
+
+
+def get_digest(value: int | str) -> bytes:
+    return hmac.digest(settings.recording_salt.encode(), str(value).encode(), "sha256")
+
+
+def anonymize_id(value: int) -> int:
+    # 48 bits keep ids apart and within the integers json readers handle exactly
+    anonymous_id = int.from_bytes(get_digest(value)[:6]) + 10**9
+
+    # keep the sign so group chats (negative ids) stay group chats
+    return -anonymous_id if value < 0 else anonymous_id
+
+
+def anonymize_string_id(value: str) -> str:
+    return get_digest(value)[:16].hex()
+
+
+def anonymize_text(text: str) -> str:
+    # commands and keyboard buttons drive the bot, anything else is typed by users
+    if text.startswith("/"):
+        return text.split()[0]
+
+    return text if get_button_id(text) else "<text>"
+
+
+def anonymize_callback_data(data: str) -> str:
+    # the action and its words and numbers keep their shape, ids are hashed
+    action, *arguments = data.split(";")
+
+    return ";".join(
+        [
+            action,
+            *(
+                argument
+                if argument.isdigit() or argument.isalpha()
+                else anonymize_string_id(argument)
+                for argument in arguments
+            ),
+        ]
+    )
+
+
+def is_id(key: str) -> bool:
+    return (key == "id" or key.endswith("_id")) and key not in SEQUENCE_IDS
+
+
+def anonymize_field(key: str, value: Any) -> Any:
+    if key in SEQUENCE_IDS or key in STRUCTURAL_FIELDS:
+        return value
+
+    if key in PLACEHOLDER_FIELDS:
+        return key
+
+    if key in CONTAINER_FIELDS:
+        return anonymize(value)
+
+    if key in FREE_TEXT_FIELDS and isinstance(value, str):
+        return anonymize_text(value)
+
+    if key == "data" and isinstance(value, str):
+        return anonymize_callback_data(value)
+
+    if is_id(key) and isinstance(value, int):
+        return anonymize_id(value)
+
+    if is_id(key) and isinstance(value, str):
+        return anonymize_string_id(value)
+
+    return None
+
+
+def anonymize(value: Any) -> Any:
+    if isinstance(value, list):
+        return [anonymize(item) for item in value]
+
+    if not isinstance(value, dict):
+        return value
+
+    anonymized = {}
+
+    for key, item in value.items():
+        if (anonymized_item := anonymize_field(key, item)) is not None:
+            anonymized[key] = anonymized_item
+
+    return anonymized
+
+
+class UpdateRecorder:
+    def __init__(self) -> None:
+        self.buffer: list[str] = []
+        self.path: Path | None = None
+        self.recorded = 0
+
+        self.task: asyncio.Task[None] | None = None
+        self.full = asyncio.Event()
+        self.stopping = False
+
+    def record(self, update: dict[str, Any]) -> None:
+        user_id = next(
+            (
+                value["from"]["id"]
+                for value in update.values()
+                if isinstance(value, dict) and "from" in value
+            ),
+            None,
+        )
+
+        line = {
+            "timestamp": time.time(),
+            "admin": user_id in settings.bot_admin_chat_ids,
+            "update": anonymize(update),
+        }
+        self.buffer.append(json.dumps(line, ensure_ascii=False))
+
+        if len(self.buffer) >= settings.recording_flush_size:
+            self.full.set()
+
+    async def flush(self) -> None:
+        lines, self.buffer = self.buffer, []
+
+        # compressing and writing would block the webhook, a thread does it
+        if lines:
+            await asyncio.to_thread(self.write, lines)
+
+    def write(self, lines: list[str]) -> None:
+        if self.path is None or self.recorded >= settings.recording_file_updates:
+            directory = Path(settings.recording_directory)
+            directory.mkdir(parents=True, exist_ok=True)
+
+            self.path = directory / f"updates-{datetime.now():%Y%m%d-%H%M%S}.jsonl.gz"
+            self.recorded = 0
+
+        try:
+            with gzip.open(self.path, "at", encoding="utf-8") as file:
+                file.write("\n".join(lines) + "\n")
+
+        except OSError as exc:
+            logger.error(f"Unable to record {len(lines)} updates", exc_info=exc)
+            return
+
+        self.recorded += len(lines)
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        # a write is never cancelled halfway, the task finishes it and exits
+        self.stopping = True
+        self.full.set()
+
+        if self.task:
+            await self.task
+
+        await self.flush()
+
+    async def run(self) -> None:
+        while not self.stopping:
+            await self.full.wait()
+            self.full.clear()
+
+            try:
+                await self.flush()
+            except Exception as exc:
+                logger.error("Unable to flush recorded updates", exc_info=exc)
+
+
+recorder = UpdateRecorder()
@@ -2,12 +2,23 @@
 
 # pyright: reportMissingTypeArgument=false
 
-from fastapi import APIRouter, Header, Response, status
+import hmac
+from typing import Any, cast
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from fastapi.responses import FileResponse, PlainTextResponse
 from pydantic import BaseModel
 from telegram import Update
 
+from .backend import get_circuit_breaker_states
 from .config import settings
+from .funnel import get_funnel_export, list_funnel_exports
+from .health import get_readiness
+from .metrics import render_metrics
+from .profiling import format_profile, get_profile, list_profiles
+from .recording import recorder
 from .telegram import telegram_application
+from .updates import process_update
 
 
 class TelegramWebhook(BaseModel):
@@ -33,7 +44,17 @@ class TelegramWebhook(BaseModel):
     chat_join_request: dict | None
 
 
+def verify_admin_token(x_admin_token: str | None = Header(default=None)) -> None:
+    # a constant time comparison leaks nothing about the token through timing
+    if not settings.admin_api_token or not hmac.compare_digest(
+        (x_admin_token or "").encode(), settings.admin_api_token.encode()
+    ):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+
+
 router = APIRouter(tags=["telegram", "webhook"])
+monitoring_router = APIRouter(tags=["monitoring"])
+admin_router = APIRouter(tags=["admin"], dependencies=[Depends(verify_admin_token)])
 
 
 @router.post("/")
@@ -44,7 +65,66 @@ async def handle_telegram_webhook(
     if x_telegram_bot_api_secret_token != settings.telegram_webhook_token:
         return Response(status_code=status.HTTP_401_UNAUTHORIZED)
 
-    update = Update.de_json(dict(telegram_webhook), telegram_application.bot)
-    await telegram_application.process_update(update)
+    if settings.recording_enabled:
+        recorder.record(telegram_webhook.dict(exclude_none=True))
+
+    update = cast(
+        Update, Update.de_json(dict(telegram_webhook), telegram_application.bot)
+    )
+    await process_update(update)
 
     return Response(status_code=status.HTTP_200_OK)
+
+
+@monitoring_router.get("/healthz")
+async def get_liveness() -> dict[str, str]:
+    return {"status": "ok"}
+
+
+@monitoring_router.get("/readyz")
+async def get_readiness_status(response: Response) -> dict[str, Any]:
+    ready, readiness = await get_readiness()
+
+    if not ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+
+    return readiness
+
+
+@monitoring_router.get("/circuit-breakers")
+async def get_circuit_breakers() -> dict[str, dict[str, Any]]:
+    return get_circuit_breaker_states()
+
+
+@monitoring_router.get("/metrics")
+async def get_metrics() -> Response:
+    return Response(content=render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@admin_router.get("/profiles")
+async def get_profiles() -> list[str]:
+    return [path.name for path in list_profiles()]
+
+
+@admin_router.get("/profiles/{name}")
+async def download_profile(name: str, text: bool = False) -> Response:
+    if not (path := get_profile(name)):
+        return Response(status_code=status.HTTP_404_NOT_FOUND)
+
+    if text:
+        return PlainTextResponse(format_profile(path))
+
+    return FileResponse(path, filename=name)
+
+
+@admin_router.get("/funnel-exports")
+async def get_funnel_exports() -> list[str]:
+    return [path.name for path in list_funnel_exports()]
+
+
+@admin_router.get("/funnel-exports/{name}")
+async def download_funnel_export(name: str) -> Response:
+    if not (path := get_funnel_export(name)):
+        return Response(status_code=status.HTTP_404_NOT_FOUND)
+
+    return FileResponse(path, filename=name)
@@ -0,0 +1,110 @@
+import asyncio
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from logging import getLogger
+
+from .config import settings
+from .storage import service_redis
+
+logger = getLogger("service")
+
+
+def get_day(days_ago: int = 0) -> str:
+    # a shared UTC day keeps every worker writing to the same keys
+    return f"{datetime.now(timezone.utc) - timedelta(days=days_ago):%Y%m%d}"
+
+
+def get_users_key(day: str) -> str:
+    return f"stats:users:{day}"
+
+
+def get_counters_key(day: str) -> str:
+    return f"stats:counters:{day}"
+
+
+class StatisticsBuffer:
+    def __init__(self) -> None:
+        self.users: dict[str, set[int]] = {}
+        self.counters: dict[str, Counter[str]] = {}
+
+        self.task: asyncio.Task[None] | None = None
+
+    def record_user(self, telegram_id: int) -> None:
+        self.users.setdefault(get_day(), set()).add(telegram_id)
+
+    def increment(self, name: str) -> None:
+        self.counters.setdefault(get_day(), Counter())[name] += 1
+
+    async def flush(self) -> None:
+        users, self.users = self.users, {}
+        counters, self.counters = self.counters, {}
+
+        # redis calls are blocking, a thread keeps them off the event loop
+        if users or counters:
+            await asyncio.to_thread(self.write, users, counters)
+
+    def write(
+        self, users: dict[str, set[int]], counters: dict[str, Counter[str]]
+    ) -> None:
+        with service_redis.pipeline(transaction=False) as pipeline:
+            for day, telegram_ids in users.items():
+                pipeline.pfadd(get_users_key(day), *telegram_ids)
+                pipeline.expire(get_users_key(day), settings.stats_ttl)
+
+            for day, day_counters in counters.items():
+                for name, amount in day_counters.items():
+                    pipeline.hincrby(get_counters_key(day), name, amount)
+
+                pipeline.expire(get_counters_key(day), settings.stats_ttl)
+
+            pipeline.execute()
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.task:
+            self.task.cancel()
+
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+        try:
+            await self.flush()
+        except Exception as exc:
+            logger.error("Unable to flush statistics", exc_info=exc)
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.stats_flush_interval)
+
+            try:
+                await self.flush()
+            except Exception as exc:
+                logger.error("Unable to flush statistics", exc_info=exc)
+
+
+statistics = StatisticsBuffer()
+
+
+def get_statistics(days: int) -> tuple[int, Counter[str]]:
+    day_keys = [get_day(days_ago) for days_ago in range(days)]
+
+    with service_redis.pipeline(transaction=False) as pipeline:
+        # PFCOUNT over several keys counts the union, a user active on
+        # several days is counted once
+        pipeline.pfcount(*(get_users_key(day) for day in day_keys))
+
+        for day in day_keys:
+            pipeline.hgetall(get_counters_key(day))
+
+        users, *day_counters = pipeline.execute()
+
+    counters: Counter[str] = Counter()
+
+    for day_counter in day_counters:
+        counters.update({name: int(amount) for name, amount in day_counter.items()})
+
+    return users, counters
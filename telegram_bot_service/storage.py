@@ -0,0 +1,116 @@
+import secrets
+import time
+from typing import Any, Callable
+
+from redis import Redis
+from redis.client import Pipeline
+from redis.exceptions import WatchError
+
+from .config import settings
+from .metrics import redis_command_duration, redis_pipelined_commands
+from .tracing import start_span
+
+
+def get_db_label(client: Redis | Pipeline) -> str:
+    return str(client.connection_pool.connection_kwargs.get("db", 0))
+
+
+def observe_command(client: Redis | Pipeline, name: str, started: float) -> None:
+    redis_command_duration.observe(
+        time.perf_counter() - started, get_db_label(client), name
+    )
+
+
+class InstrumentedPipeline(Pipeline):
+    def immediate_execute_command(self, *args: Any, **options: Any) -> Any:
+        # commands run at once while watching keys, before MULTI
+        started = time.perf_counter()
+
+        try:
+            with start_span(f"redis {args[0]}"):
+                return super().immediate_execute_command(*args, **options)
+        finally:
+            observe_command(self, str(args[0]), started)
+
+    def execute(self, raise_on_error: bool = True) -> list[Any]:
+        for args, _ in self.command_stack:
+            redis_pipelined_commands.inc(get_db_label(self), str(args[0]))
+
+        started = time.perf_counter()
+
+        try:
+            with start_span("redis PIPELINE", commands=len(self.command_stack)):
+                return super().execute(raise_on_error)
+        finally:
+            observe_command(self, "PIPELINE", started)
+
+
+class InstrumentedRedis(Redis):
+    def execute_command(self, *args: Any, **options: Any) -> Any:
+        started = time.perf_counter()
+
+        try:
+            with start_span(f"redis {args[0]}"):
+                return super().execute_command(*args, **options)
+        finally:
+            observe_command(self, str(args[0]), started)
+
+    def pipeline(
+        self, transaction: bool = True, shard_hint: Any = None
+    ) -> InstrumentedPipeline:
+        return InstrumentedPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+
+
+redis_clients: list[Redis] = []
+
+
+def create_redis(db: int) -> Redis:
+    client = InstrumentedRedis(
+        host=settings.redis_host, port=settings.redis_port, db=db, decode_responses=True
+    )
+    redis_clients.append(client)
+
+    return client
+
+
+service_redis = create_redis(settings.redis_service_db)
+
+
+class Lease:
+    def __init__(
+        self, client: Redis, key: str, ttl: float, token: str | None = None
+    ) -> None:
+        self.client = client
+        self.key = key
+        self.ttl = int(ttl * 1000)
+
+        # every holder has its own token, a lease is only renewed by its owner
+        self.token = token or secrets.token_hex(16)
+
+    def acquire(self) -> bool:
+        return bool(self.client.set(self.key, self.token, nx=True, px=self.ttl))
+
+    def renew(self) -> bool:
+        return self.if_owned(lambda pipeline: pipeline.pexpire(self.key, self.ttl))
+
+    def release(self) -> bool:
+        return self.if_owned(lambda pipeline: pipeline.delete(self.key))
+
+    def if_owned(self, command: Callable[[Pipeline], Any]) -> bool:
+        # the transaction is discarded if the lease changes hands after the check
+        with self.client.pipeline() as pipeline:
+            try:
+                pipeline.watch(self.key)
+
+                if pipeline.get(self.key) != self.token:
+                    return False
+
+                pipeline.multi()
+                command(pipeline)
+                pipeline.execute()
+            except WatchError:
+                return False
+
+        return True
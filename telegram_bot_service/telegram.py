@@ -1,15 +1,55 @@
+import time
+from typing import Any
+
+import httpx
+from fastapi import status
 from telegram.constants import ParseMode
-from telegram.ext import Application, Defaults
+from telegram.ext import Application, Defaults, ExtBot
+from telegram.request import HTTPXRequest
 
+from .backend import get_ssl_context
 from .config import settings
+from .metrics import bot_api_rate_limited, bot_api_request_duration
+from .tracing import start_span
 from .types import TelegramApplication
 
+
+class InstrumentedRequest(HTTPXRequest):
+    def _build_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            verify=get_ssl_context(), **self._client_kwargs  # type: ignore [arg-type]
+        )
+
+    async def do_request(
+        self, url: str, method: str, *args: Any, **kwargs: Any
+    ) -> tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+
+        try:
+            with start_span(f"bot_api {api_method}"):
+                status_code, payload = await super().do_request(
+                    url, method, *args, **kwargs
+                )
+        finally:
+            bot_api_request_duration.observe(time.perf_counter() - started, api_method)
+
+        if status_code == status.HTTP_429_TOO_MANY_REQUESTS:
+            bot_api_rate_limited.inc(api_method)
+
+        return status_code, payload
+
+
 defaults = Defaults(parse_mode=ParseMode.MARKDOWN)
 
+bot: ExtBot[None] = ExtBot(
+    token=settings.telegram_bot_token,
+    base_url=settings.telegram_api_base_url,
+    request=InstrumentedRequest(connection_pool_size=256),
+    get_updates_request=InstrumentedRequest(),
+    defaults=defaults,
+)
+
 telegram_application: TelegramApplication = (
-    Application.builder()
-    .token(settings.telegram_bot_token)
-    .concurrent_updates(True)
-    .defaults(defaults)
-    .build()
+    Application.builder().bot(bot).concurrent_updates(True).build()
 )
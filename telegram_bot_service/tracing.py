@@ -0,0 +1,134 @@
+import asyncio
+import json
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from logging import getLogger
+from typing import Any, Iterator
+
+import httpx
+
+from .config import settings
+
+logger = getLogger("service")
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: str | None
+
+    start: float = field(default_factory=time.time)
+    duration: float | None = None
+    attributes: dict[str, Any] = field(default_factory=dict)
+    error: str | None = None
+
+
+class TraceExporter:
+    def __init__(self) -> None:
+        self.buffer: list[dict[str, Any]] = []
+        self.flush_task: asyncio.Task[None] | None = None
+
+    def add(self, spans: list[Span]) -> None:
+        self.buffer.extend(asdict(span) for span in spans)
+
+        if len(self.buffer) >= settings.tracing_batch_size and not self.flush_task:
+            self.flush_task = asyncio.create_task(self.flush())
+
+    async def flush(self) -> None:
+        spans, self.buffer = self.buffer, []
+
+        try:
+            if spans and settings.tracing_export_path:
+                await asyncio.to_thread(self._write, spans)
+
+            if spans and settings.tracing_collector_url:
+                async with httpx.AsyncClient() as client:
+                    await client.post(
+                        settings.tracing_collector_url, json={"spans": spans}
+                    )
+
+        except (OSError, httpx.HTTPError) as exc:
+            logger.error(f"Unable to export {len(spans)} spans", exc_info=exc)
+
+        finally:
+            self.flush_task = None
+
+    def _write(self, spans: list[dict[str, Any]]) -> None:
+        with open(settings.tracing_export_path, "a") as file:  # type: ignore [arg-type]
+            file.writelines(
+                json.dumps(span, ensure_ascii=False, default=str) + "\n"
+                for span in spans
+            )
+
+
+exporter = TraceExporter()
+
+current_trace: ContextVar[list[Span] | None] = ContextVar("current_trace", default=None)
+current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+def generate_id() -> str:
+    return f"{random.getrandbits(64):016x}"
+
+
+@contextmanager
+def record_span(span: Span) -> Iterator[Span]:
+    token = current_span.set(span)
+    started = time.perf_counter()
+
+    try:
+        yield span
+    except BaseException as exc:
+        span.error = repr(exc)
+        raise
+    finally:
+        span.duration = time.perf_counter() - started
+        current_span.reset(token)
+
+
+@contextmanager
+def start_trace(name: str, **attributes: Any) -> Iterator[Span | None]:
+    if not settings.tracing_enabled:
+        yield None
+        return
+
+    spans: list[Span] = []
+    root = Span(name, generate_id(), generate_id(), None, attributes=attributes)
+    trace_token = current_trace.set(spans)
+
+    try:
+        with record_span(root):
+            yield root
+
+    finally:
+        current_trace.reset(trace_token)
+
+        # tail-based policy: slow traces are always kept, the rest are sampled
+        if (
+            root.duration >= settings.tracing_slow_threshold  # type: ignore [operator]
+            or random.random() < settings.tracing_sample_rate
+        ):
+            exporter.add([root, *spans])
+
+
+@contextmanager
+def start_span(name: str, **attributes: Any) -> Iterator[Span | None]:
+    spans = current_trace.get()
+    parent = current_span.get()
+
+    if spans is None or parent is None:
+        yield None
+        return
+
+    span = Span(
+        name, parent.trace_id, generate_id(), parent.span_id, attributes=attributes
+    )
+    spans.append(span)
+
+    with record_span(span):
+        yield span
@@ -1,12 +1,28 @@
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
 from enum import Enum
-from typing import TypedDict
+from typing import Any, TypedDict
 
-import httpx
 from fastapi import status
 from fastapi.encoders import jsonable_encoder
-from pydantic import BaseModel
 
+from .backend import BackendService
 from .config import settings
+from .health import register_warm_up
+from .metrics import training_plan_cache_lookups
+from .models import decode_json, decode_json_list, encode_json
+from .storage import service_redis
+
+CATALOG_GENERATION_KEY = "training_plans:generation"
+
+training_plan_service = BackendService(
+    "training-plan-service",
+    settings.training_plan_service_url,
+    settings.training_plan_service_timeout,
+    hedging=settings.training_plan_service_hedging,
+)
 
 
 class Sex(Enum):
@@ -50,7 +66,8 @@ class Environment(Enum):
 FilterEnum = Sex | Goal | Environment | Level | Frequency
 
 
-class TrainingPlan(BaseModel):
+@dataclass(frozen=True, slots=True)
+class TrainingPlan:
     notion_id: str
     url: str
 
@@ -58,6 +75,16 @@ class TrainingPlan(BaseModel):
     price: float
     content_url: str
 
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "TrainingPlan":
+        return cls(
+            notion_id=data["notion_id"],
+            url=data["url"],
+            title=data["title"],
+            price=float(data["price"]),
+            content_url=data["content_url"],
+        )
+
 
 class FiltersDict(TypedDict):
     sex: Sex | None
@@ -67,46 +94,176 @@ class FiltersDict(TypedDict):
     frequency: Frequency | None
 
 
-async def get_training_plans(filters: FiltersDict) -> list[TrainingPlan]:
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            url=settings.training_plan_service_url + "/",
-            timeout=settings.training_plan_service_timeout,
-            params=jsonable_encoder(filters, exclude_none=True),
+class TrainingPlanCache:
+    def __init__(self) -> None:
+        self.plans: OrderedDict[str, tuple[TrainingPlan, float, int]] = OrderedDict()
+
+    def get(self, training_plan_id: str, generation: int) -> TrainingPlan | None:
+        if (entry := self.plans.get(training_plan_id)) is None:
+            return None
+
+        training_plan, expires_at, plan_generation = entry
+
+        if plan_generation != generation or expires_at < time.monotonic():
+            del self.plans[training_plan_id]
+            return None
+
+        self.plans.move_to_end(training_plan_id)
+        return training_plan
+
+    def put(self, training_plan: TrainingPlan, generation: int) -> None:
+        self.plans[training_plan.notion_id] = (
+            training_plan,
+            time.monotonic() + settings.training_plan_cache_ttl,
+            generation,
         )
+        self.plans.move_to_end(training_plan.notion_id)
+
+        if len(self.plans) > settings.training_plan_cache_size:
+            self.plans.popitem(last=False)
+
+    def clear(self) -> None:
+        self.plans.clear()
+
+
+training_plan_cache = TrainingPlanCache()
+
+
+class CatalogGeneration:
+    def __init__(self) -> None:
+        self.generation = 0
+        self.expires_at = 0.0
+
+    def get(self) -> int:
+        # a sync in another process reaches this one within the ttl,
+        # until then memory hits need no round trip to Redis
+        if self.expires_at < time.monotonic():
+            self.set(int(service_redis.get(CATALOG_GENERATION_KEY) or 0))
+
+        return self.generation
+
+    def set(self, generation: int) -> None:
+        self.generation = generation
+        self.expires_at = time.monotonic() + settings.training_plan_generation_ttl
+
+
+catalog_generation = CatalogGeneration()
+
+
+def get_catalog_generation() -> int:
+    return catalog_generation.get()
+
+
+def get_training_plan_key(training_plan_id: str, generation: int) -> str:
+    # keys of earlier generations are never read again and expire on their own
+    return f"training_plan:{generation}:{training_plan_id}"
+
 
-    return [TrainingPlan(**plan) for plan in response.json()]
+async def cache_training_plans(
+    training_plans: list[TrainingPlan], generation: int
+) -> None:
+    # plans still cached in this process are in redis under the same generation,
+    # every survey listing would otherwise write the whole list again
+    new_plans = [
+        training_plan
+        for training_plan in training_plans
+        if training_plan_cache.get(training_plan.notion_id, generation) is None
+    ]
+
+    if not new_plans:
+        return
+
+    for training_plan in new_plans:
+        training_plan_cache.put(training_plan, generation)
+
+    # redis calls are blocking, a thread keeps them off the event loop
+    await asyncio.to_thread(write_training_plans, new_plans, generation)
+
+
+def write_training_plans(training_plans: list[TrainingPlan], generation: int) -> None:
+    # the generation is read before the plans are requested, so plans fetched
+    # while a catalog sync completes are never cached as current
+    with service_redis.pipeline() as pipeline:
+        for training_plan in training_plans:
+            pipeline.set(
+                get_training_plan_key(training_plan.notion_id, generation),
+                encode_json(training_plan),
+                ex=settings.training_plan_cache_ttl,
+            )
+
+        pipeline.execute()
+
+
+async def get_training_plans(filters: FiltersDict) -> list[TrainingPlan]:
+    generation = get_catalog_generation()
+
+    response = await training_plan_service.request(
+        "GET", "/", params=jsonable_encoder(filters, exclude_none=True)
+    )
+
+    training_plans = decode_json_list(TrainingPlan, response.content)
+    await cache_training_plans(training_plans, generation)
+
+    return training_plans
+
+
+@register_warm_up("training_plans")
+async def warm_up_training_plans() -> None:
+    await get_training_plans(
+        FiltersDict(sex=None, goal=None, environment=None, level=None, frequency=None)
+    )
 
 
 async def fetch_training_plans() -> bool:
-    async with httpx.AsyncClient() as client:
-        response = await client.put(
-            url=settings.training_plan_service_url + "/",
-            timeout=settings.training_plan_service_timeout,
-        )
+    # the Notion sync takes far longer than regular catalog requests
+    response = await training_plan_service.request(
+        "PUT", "/", timeout=settings.training_plan_fetch_timeout
+    )
+
+    if response.status_code != status.HTTP_204_NO_CONTENT:
+        return False
+
+    # in-process plan caches compare generations and drop stale entries at once
+    catalog_generation.set(service_redis.incr(CATALOG_GENERATION_KEY))
+    training_plan_cache.clear()
 
-    return response.status_code == status.HTTP_204_NO_CONTENT
+    return True
 
 
 async def get_training_plan(training_plan_id: str) -> TrainingPlan:
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            url=settings.training_plan_service_url + f"/{training_plan_id}/",
-            timeout=settings.training_plan_service_timeout,
-        )
+    generation = get_catalog_generation()
+
+    if training_plan := training_plan_cache.get(training_plan_id, generation):
+        training_plan_cache_lookups.inc("memory")
+        return training_plan
+
+    if raw_training_plan := service_redis.get(
+        get_training_plan_key(training_plan_id, generation)
+    ):
+        training_plan_cache_lookups.inc("redis")
 
-    return TrainingPlan(**response.json())
+        training_plan = decode_json(TrainingPlan, raw_training_plan)
+        training_plan_cache.put(training_plan, generation)
+
+        return training_plan
+
+    training_plan_cache_lookups.inc("miss")
+
+    response = await training_plan_service.request("GET", f"/{training_plan_id}/")
+
+    training_plan = decode_json(TrainingPlan, response.content)
+    await cache_training_plans([training_plan], generation)
+
+    return training_plan
 
 
 async def get_property_values(
     filter_enum: type[FilterEnum], filters: FiltersDict
 ) -> list[FilterEnum]:
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            url=settings.training_plan_service_url
-            + f"/property/{filter_enum.__name__.lower()}/",
-            timeout=settings.training_plan_service_timeout,
-            params=jsonable_encoder(filters, exclude_none=True),
-        )
+    response = await training_plan_service.request(
+        "GET",
+        f"/property/{filter_enum.__name__.lower()}/",
+        params=jsonable_encoder(filters, exclude_none=True),
+    )
 
     return [filter_enum(value) for value in response.json()]
@@ -0,0 +1,112 @@
+import asyncio
+import time
+from collections import Counter
+from logging import getLogger
+
+from telegram import Update
+
+from .config import settings
+from .funnel import funnel_recorder
+from .handlers import get_conversation_state
+from .lanes import classify_update, lane_semaphores
+from .metrics import lane_wait_duration, updates_total
+from .profiling import profile_update
+from .rate_limiting import is_rate_limited
+from .statistics import statistics
+from .telegram import telegram_application
+from .tracing import start_trace
+
+logger = getLogger("service")
+
+
+class UpdateTracker:
+    def __init__(self) -> None:
+        self.in_flight: dict[int, str] = {}
+        # telegram redelivers an update it got no answer for, even while in flight
+        self.copies: Counter[int] = Counter()
+
+    def add(self, update_id: int, update_type: str) -> None:
+        self.in_flight[update_id] = update_type
+        self.copies[update_id] += 1
+
+    def remove(self, update_id: int) -> None:
+        self.copies[update_id] -= 1
+
+        if self.copies[update_id] <= 0:
+            del self.copies[update_id]
+            self.in_flight.pop(update_id, None)
+
+    async def drain(self, timeout: float) -> dict[int, str]:
+        deadline = time.monotonic() + timeout
+
+        while self.in_flight and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+        return dict(self.in_flight)
+
+
+tracker = UpdateTracker()
+
+
+def get_update_type(update: Update) -> str:
+    return next(
+        (
+            str(update_type)
+            for update_type in Update.ALL_TYPES
+            if getattr(update, update_type) is not None
+        ),
+        "unknown",
+    )
+
+
+async def process_update(update: Update) -> None:
+    update_type = get_update_type(update)
+    updates_total.inc(update_type)
+
+    tracker.add(update.update_id, update_type)
+
+    try:
+        await dispatch_update(update, update_type)
+    finally:
+        tracker.remove(update.update_id)
+
+
+async def dispatch_update(update: Update, update_type: str) -> None:
+    if await is_rate_limited(update):
+        return
+
+    lane = classify_update(update)
+    queued = time.perf_counter()
+
+    async with lane_semaphores[lane]:
+        lane_wait_duration.observe(time.perf_counter() - queued, lane.value)
+
+        with start_trace(
+            "update",
+            update_id=update.update_id,
+            update_type=update_type,
+            lane=lane.value,
+        ), profile_update(update.update_id, update_type):
+            await process_tracked_update(update)
+
+
+async def process_tracked_update(update: Update) -> None:
+    user, chat = update.effective_user, update.effective_chat
+
+    if not user or not chat:
+        await telegram_application.process_update(update)
+        return
+
+    statistics.record_user(user.id)
+    state = get_conversation_state(chat.id, user.id)
+
+    await telegram_application.process_update(update)
+
+    if (new_state := get_conversation_state(chat.id, user.id)) != state:
+        if settings.funnel_enabled:
+            funnel_recorder.record(update, user.id, state, new_state)
+
+        statistics.increment(
+            f"transition:{state.name if state else None}->"
+            f"{new_state.name if new_state else None}"
+        )
@@ -1,24 +1,49 @@
-import httpx
-from pydantic import BaseModel
+from dataclasses import dataclass
+from typing import Any
+
 from fastapi.encoders import jsonable_encoder
 
+from .backend import BackendService
 from .config import settings
+from .models import decode_json, decode_json_list
+
+user_service = BackendService(
+    "user-service", settings.user_service_url, settings.user_service_timeout
+)
 
 
-class User(BaseModel):
+@dataclass(frozen=True, slots=True)
+class User:
     telegram_id: int
 
     first_name: str
-    last_name: str | None
-    username: str | None
+    last_name: str | None = None
+    username: str | None = None
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "User":
+        return cls(
+            telegram_id=int(data["telegram_id"]),
+            first_name=data["first_name"],
+            last_name=data.get("last_name"),
+            username=data.get("username"),
+        )
 
 
 async def create_user(user: User) -> User:
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            url=settings.user_service_url + "/",
-            timeout=settings.user_service_timeout,
-            json=jsonable_encoder(user),
-        )
+    response = await user_service.request("POST", "/", json=jsonable_encoder(user))
+
+    return decode_json(User, response.content)
+
+
+async def get_users(offset: int, limit: int) -> tuple[list[User], int | None]:
+    response = await user_service.request(
+        "GET", "/", params={"offset": offset, "limit": limit}
+    )
+    response.raise_for_status()
+
+    total = response.headers.get("X-Total-Count")
 
-    return User(**response.json())
+    return decode_json_list(User, response.content), (
+        int(total) if total is not None else None
+    )